@@ -1,13 +1,25 @@
 # db.py
 from __future__ import annotations
 
+import functools
+import hashlib
+import queue
+import random
 import sqlite3
-from typing import Any, Dict, List, Optional, Tuple
+import threading
+from collections.abc import Mapping
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 DB_PATH = "app.db"
 
+# One connection per thread, opened on first use and kept for the thread's lifetime
+# (FastAPI runs sync handlers on a fixed threadpool, so this is a handful of connections).
+_tls = threading.local()
 
-def get_conn() -> sqlite3.Connection:
+
+def _connect() -> sqlite3.Connection:
     conn = sqlite3.connect(DB_PATH, check_same_thread=False)
     conn.row_factory = sqlite3.Row
     # Enable FK constraints (sqlite defaults to OFF)
@@ -18,13 +30,59 @@ def get_conn() -> sqlite3.Connection:
     return conn
 
 
-def init_db() -> None:
-    """Initialize tables and insert default settings keys if missing."""
+def get_conn() -> sqlite3.Connection:
+    conn = getattr(_tls, "conn", None)
+    if conn is None:
+        conn = _connect()
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -20000")
+        _tls.conn = conn
+    elif conn.in_transaction and not getattr(_tls, "tx_depth", 0):
+        # a write on this thread raised before its commit
+        conn.rollback()
+    return conn
+
+
+@contextmanager
+def tx() -> Iterator[sqlite3.Cursor]:
+    """Write transaction on this thread's connection: commit on exit, rollback on error.
+
+    Nested tx() blocks (e.g. a caller wrapping a loop of writer calls) join the
+    outermost one, so the whole batch commits once.
+    """
     conn = get_conn()
-    cur = conn.cursor()
+    depth = getattr(_tls, "tx_depth", 0)
+    if depth == 0:
+        conn.execute("BEGIN IMMEDIATE")
+        _tls.after_commit = []
+    _tls.tx_depth = depth + 1
+    try:
+        yield conn.cursor()
+        if depth == 0:
+            conn.commit()
+    except BaseException:
+        if depth == 0:
+            conn.rollback()
+            _tls.after_commit = []
+        raise
+    finally:
+        _tls.tx_depth = depth
+    if depth == 0:
+        hooks, _tls.after_commit = _tls.after_commit, []
+        for fn in hooks:
+            fn()
+
+
+def _after_commit(fn) -> None:
+    """Run fn once the current write is committed (right away outside a tx())."""
+    if getattr(_tls, "tx_depth", 0):
+        _tls.after_commit.append(fn)
+    else:
+        fn()
 
-    cur.execute(
-        """
+
+_SCHEMA = """
     CREATE TABLE IF NOT EXISTS documents (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
       title TEXT NOT NULL,
@@ -34,13 +92,10 @@ def init_db() -> None:
       pages INTEGER DEFAULT 0,
       doc_type TEXT DEFAULT 'pdf',
       search_text TEXT DEFAULT '',
+      status TEXT NOT NULL DEFAULT 'ready',
       created_at TEXT DEFAULT (datetime('now'))
-    )
-    """
-    )
+    );
 
-    cur.execute(
-        """
     CREATE TABLE IF NOT EXISTS notes (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
       title TEXT NOT NULL,
@@ -48,23 +103,15 @@ def init_db() -> None:
       document_id INTEGER NULL,
       created_at TEXT DEFAULT (datetime('now')),
       FOREIGN KEY(document_id) REFERENCES documents(id)
-    )
-    """
-    )
+    );
 
-    # Key-value settings table
-    cur.execute(
-        """
+    -- Key-value settings table
     CREATE TABLE IF NOT EXISTS settings (
       key TEXT PRIMARY KEY,
       value TEXT NOT NULL
-    )
-    """
-    )
+    );
 
-    # ---------------- Study (cards + simple SRS + reviews) ----------------
-    cur.execute(
-        """
+    -- ---------------- Study (cards + simple SRS + reviews) ----------------
     CREATE TABLE IF NOT EXISTS study_cards (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
       document_id INTEGER NULL,
@@ -75,12 +122,8 @@ def init_db() -> None:
       created_at TEXT DEFAULT (datetime('now')),
       FOREIGN KEY(document_id) REFERENCES documents(id) ON DELETE SET NULL,
       FOREIGN KEY(note_id) REFERENCES notes(id) ON DELETE SET NULL
-    )
-    """
-    )
+    );
 
-    cur.execute(
-        """
     CREATE TABLE IF NOT EXISTS study_srs (
       card_id INTEGER PRIMARY KEY,
       box INTEGER NOT NULL DEFAULT 1,
@@ -88,12 +131,8 @@ def init_db() -> None:
       last_review_at TEXT NULL,
       correct_streak INTEGER NOT NULL DEFAULT 0,
       FOREIGN KEY(card_id) REFERENCES study_cards(id) ON DELETE CASCADE
-    )
-    """
-    )
+    );
 
-    cur.execute(
-        """
     CREATE TABLE IF NOT EXISTS study_reviews (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
       card_id INTEGER NOT NULL,
@@ -101,13 +140,37 @@ def init_db() -> None:
       source TEXT NOT NULL DEFAULT 'session',
       created_at TEXT DEFAULT (datetime('now')),
       FOREIGN KEY(card_id) REFERENCES study_cards(id) ON DELETE CASCADE
-    )
-    """
-    )
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_study_cards_doc ON study_cards(document_id);
+    -- (due_at, box) + the card_id rowid is exactly the due picker's ORDER BY
+    DROP INDEX IF EXISTS idx_study_srs_due;
+    CREATE INDEX IF NOT EXISTS idx_study_srs_due_box ON study_srs(due_at, box);
+    CREATE INDEX IF NOT EXISTS idx_notes_doc ON notes(document_id, id DESC);
+    CREATE INDEX IF NOT EXISTS idx_study_reviews_card ON study_reviews(card_id);
+
+    -- Defaults (existing values win)
+    INSERT OR IGNORE INTO settings(key, value) VALUES
+      ('ui_lang', 'hu'),
+      ('answer_language', 'hu'),
+      ('theme', 'dark'),
+      ('manual_mode', '0'),
+      ('translation_style', 'precise'),
+      ('default_gpt_mode', 'exam');
+"""
+
 
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_study_cards_doc ON study_cards(document_id)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_study_srs_due ON study_srs(due_at)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_study_reviews_card ON study_reviews(card_id)")
+def init_db() -> None:
+    """Initialize tables and insert default settings keys if missing."""
+    conn = _connect()
+    # WAL is persistent in the db file: readers no longer wait on writers
+    conn.execute("PRAGMA journal_mode = WAL")
+    cur = conn.cursor()
+
+    # all DDL + defaults in one script and one transaction
+    conn.executescript("BEGIN;\n" + _SCHEMA + "\nCOMMIT;")
+
+    cur.execute("BEGIN IMMEDIATE")
 
     # Migrations (lightweight): add missing columns without forcing DB reset
     cur.execute("PRAGMA table_info(study_cards)")
@@ -115,19 +178,144 @@ def init_db() -> None:
     if "explanation" not in cols:
         cur.execute("ALTER TABLE study_cards ADD COLUMN explanation TEXT NOT NULL DEFAULT ''")
 
+    cur.execute("PRAGMA table_info(documents)")
+    cols = [r["name"] for r in cur.fetchall()]
+    if "status" not in cols:
+        cur.execute("ALTER TABLE documents ADD COLUMN status TEXT NOT NULL DEFAULT 'ready'")
 
-    # Defaults
-    _set_default(cur, "ui_lang", "hu")
-    _set_default(cur, "answer_language", "hu")
-    _set_default(cur, "theme", "dark")
-    _set_default(cur, "manual_mode", "0")
-    _set_default(cur, "translation_style", "precise")
-    _set_default(cur, "default_gpt_mode", "exam")
+    # Dedup key for cards (NULL document ids compare equal through COALESCE). A DB that
+    # already holds duplicates keeps working without it: the dedup probes just scan.
+    try:
+        cur.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_study_cards_uniq "
+            "ON study_cards(COALESCE(document_id, -1), question, answer)"
+        )
+    except sqlite3.IntegrityError:
+        pass
+
+    global _fts_enabled
+    _fts_enabled = _init_fts(cur)
 
     conn.commit()
+    _bump_settings_version()
+    # refresh planner statistics so the indexes above get picked
+    conn.execute("ANALYZE")
     conn.close()
 
 
+class _RowView(Mapping):
+    """Mapping over a sqlite3.Row without copying it into a dict.
+
+    Supports row["col"], .get(), `in` and iteration like the dicts callers used to
+    get. Keys assigned afterwards (e.g. ask snippets) live in a small overlay dict
+    that is only created on first write.
+    """
+
+    __slots__ = ("_r", "_extra")
+    _ALIASES: Dict[str, str] = {}
+
+    def __init__(self, row: sqlite3.Row) -> None:
+        self._r = row
+        self._extra: Optional[Dict[str, Any]] = None
+
+    def __getitem__(self, key: str) -> Any:
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        try:
+            return self._r[self._ALIASES.get(key, key)]
+        except IndexError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __iter__(self) -> Iterator[str]:
+        cols = self._r.keys()
+        yield from cols
+        yield from (a for a, col in self._ALIASES.items() if col in cols)
+        if self._extra is not None:
+            yield from (k for k in self._extra if k not in cols and k not in self._ALIASES)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+class _DocRowView(_RowView):
+    """Document row; also answers the legacy template keys type/page_count."""
+
+    __slots__ = ()
+    _ALIASES = {"type": "doc_type", "page_count": "pages"}
+
+
+# Full-text indexes over the searched columns, kept in sync by triggers. The trigram
+# tokenizer matches arbitrary substrings, so results agree with the LIKE '%q%' fallback.
+_FTS_TABLES = (
+    ("documents_fts", "documents", ("title", "original_name", "search_text")),
+    ("notes_fts", "notes", ("title", "body")),
+)
+_fts_enabled = False
+
+
+def _init_fts(cur: sqlite3.Cursor) -> bool:
+    """Create FTS tables + sync triggers; False if this sqlite build lacks fts5/trigram."""
+    try:
+        for name, table, cols in _FTS_TABLES:
+            cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,))
+            fresh = cur.fetchone() is None
+
+            col_sql = ", ".join(cols)
+            new_sql = ", ".join(f"new.{c}" for c in cols)
+            old_sql = ", ".join(f"old.{c}" for c in cols)
+            cur.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5("
+                f"{col_sql}, content='{table}', content_rowid='id', tokenize='trigram')"
+            )
+            cur.execute(
+                f"""
+            CREATE TRIGGER IF NOT EXISTS {name}_ai AFTER INSERT ON {table} BEGIN
+              INSERT INTO {name}(rowid, {col_sql}) VALUES (new.id, {new_sql});
+            END
+            """
+            )
+            cur.execute(
+                f"""
+            CREATE TRIGGER IF NOT EXISTS {name}_ad AFTER DELETE ON {table} BEGIN
+              INSERT INTO {name}({name}, rowid, {col_sql}) VALUES ('delete', old.id, {old_sql});
+            END
+            """
+            )
+            cur.execute(
+                f"""
+            CREATE TRIGGER IF NOT EXISTS {name}_au AFTER UPDATE OF {col_sql} ON {table} BEGIN
+              INSERT INTO {name}({name}, rowid, {col_sql}) VALUES ('delete', old.id, {old_sql});
+              INSERT INTO {name}(rowid, {col_sql}) VALUES (new.id, {new_sql});
+            END
+            """
+            )
+            if fresh:
+                # backfill rows that existed before the index did
+                cur.execute(f"INSERT INTO {name}({name}) VALUES ('rebuild')")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def _fts_phrase(q: str) -> Optional[str]:
+    """q quoted as an FTS5 phrase, or None when the search has to fall back to LIKE.
+
+    Trigram indexes can't answer queries shorter than 3 characters.
+    """
+    q = (q or "").strip()
+    if not _fts_enabled or len(q) < 3:
+        return None
+    return '"' + q.replace('"', '""') + '"'
+
+
 # ---------- study cards ----------
 _LEITNER_INTERVALS_DAYS = {1: 0, 2: 1, 3: 3, 4: 7, 5: 14}
 
@@ -137,29 +325,18 @@ def _same_nullable(a: Any, b: Any) -> bool:
 
 
 def _find_existing_card_id(document_id: Optional[int], question: str, answer: str) -> Optional[int]:
-    """Dedup helper (keeps null-doc distinct)."""
+    """Dedup helper (keeps null-doc distinct); probes idx_study_cards_uniq."""
     conn = get_conn()
     cur = conn.cursor()
-    if document_id is None:
-        cur.execute(
-            """
-        SELECT id FROM study_cards
-        WHERE document_id IS NULL AND question=? AND answer=?
-        LIMIT 1
-        """,
-            (question, answer),
-        )
-    else:
-        cur.execute(
-            """
-        SELECT id FROM study_cards
-        WHERE document_id=? AND question=? AND answer=?
-        LIMIT 1
-        """,
-            (int(document_id), question, answer),
-        )
+    cur.execute(
+        """
+    SELECT id FROM study_cards
+    WHERE COALESCE(document_id, -1)=COALESCE(?, -1) AND question=? AND answer=?
+    LIMIT 1
+    """,
+        (document_id, question, answer),
+    )
     row = cur.fetchone()
-    conn.close()
     return int(row["id"]) if row else None
 
 
@@ -176,54 +353,95 @@ def create_study_card(
     if not q or not a:
         return None, False
 
-    existing = _find_existing_card_id(document_id, q, a)
-    if existing is not None:
-        return existing, False
+    # check + insert in one write transaction, so concurrent saves can't both insert
+    with tx() as cur:
+        existing = _find_existing_card_id(document_id, q, a)
+        if existing is not None:
+            return existing, False
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-    INSERT INTO study_cards(document_id, note_id, question, answer, explanation)
-    VALUES(?,?,?,?,?)
-    """,
-        (document_id, note_id, q, a, (explanation or '').strip()),
-    )
-    card_id = int(cur.lastrowid)
-    cur.execute(
-        """
-    INSERT OR REPLACE INTO study_srs(card_id, box, due_at, last_review_at, correct_streak)
-    VALUES(?, 1, date('now'), NULL, 0)
-    """,
-        (card_id,),
-    )
-    conn.commit()
-    conn.close()
+        cur.execute(
+            """
+        INSERT INTO study_cards(document_id, note_id, question, answer, explanation)
+        VALUES(?,?,?,?,?)
+        """,
+            (document_id, note_id, q, a, (explanation or '').strip()),
+        )
+        card_id = int(cur.lastrowid)
+        cur.execute(
+            """
+        INSERT OR REPLACE INTO study_srs(card_id, box, due_at, last_review_at, correct_streak)
+        VALUES(?, 1, date('now'), NULL, 0)
+        """,
+            (card_id,),
+        )
     return card_id, True
 
 
-def update_study_card(card_id: int, question: str, answer: str, explanation: str, document_id: Optional[int]) -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-    UPDATE study_cards SET question=?, answer=?, explanation=?, document_id=? WHERE id=?
-    """,
-        ((question or "").strip(), (answer or "").strip(), (explanation or "").strip(), document_id, int(card_id)),
-    )
-    conn.commit()
-    conn.close()
+def create_study_cards_bulk(
+    rows: List[Tuple[str, str, Optional[int], Optional[int], str]],
+) -> Tuple[int, int]:
+    """Batch create_study_card: rows are (question, answer, document_id, note_id, explanation).
+
+    Returns (created, duplicates). One transaction; the dedup check is part of the
+    INSERT, so repeats inside the batch are caught too. Empty q/a rows are ignored.
+    """
+    clean = []
+    for q, a, doc_id, note_id, expl in rows:
+        q = (q or "").strip()
+        a = (a or "").strip()
+        if q and a:
+            clean.append((doc_id, note_id, q, a, (expl or "").strip(), doc_id, q, a))
+    if not clean:
+        return 0, 0
+
+    with tx() as cur:
+        cur.execute("SELECT COALESCE(MAX(id), 0) AS m FROM study_cards")
+        max_before = int(cur.fetchone()["m"])
+        cur.executemany(
+            """
+        INSERT INTO study_cards(document_id, note_id, question, answer, explanation)
+        SELECT ?,?,?,?,?
+        WHERE NOT EXISTS (
+          SELECT 1 FROM study_cards
+          WHERE COALESCE(document_id, -1)=COALESCE(?, -1) AND question=? AND answer=?
+        )
+        """,
+            clean,
+        )
+        created = max(cur.rowcount, 0)
+        cur.execute(
+            """
+        INSERT OR REPLACE INTO study_srs(card_id, box, due_at, last_review_at, correct_streak)
+        SELECT id, 1, date('now'), NULL, 0 FROM study_cards WHERE id > ?
+        """,
+            (max_before,),
+        )
+    return created, len(clean) - created
+
+
+def update_study_card(card_id: int, question: str, answer: str, explanation: str, document_id: Optional[int]) -> bool:
+    """Returns False (nothing changed) if the edit would duplicate another card of the
+    same document (idx_study_cards_uniq)."""
+    with tx() as cur:
+        try:
+            cur.execute(
+                """
+            UPDATE study_cards SET question=?, answer=?, explanation=?, document_id=? WHERE id=?
+            """,
+                ((question or "").strip(), (answer or "").strip(), (explanation or "").strip(), document_id, int(card_id)),
+            )
+        except sqlite3.IntegrityError:
+            # only the failed statement is undone; the (empty) transaction still commits
+            return False
+    return True
 
 
 def delete_study_card(card_id: int) -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM study_cards WHERE id=?", (int(card_id),))
-    conn.commit()
-    conn.close()
+    with tx() as cur:
+        cur.execute("DELETE FROM study_cards WHERE id=?", (int(card_id),))
 
 
-def get_study_card(card_id: int) -> Optional[Dict[str, Any]]:
+def get_study_card(card_id: int) -> Optional[_RowView]:
     conn = get_conn()
     cur = conn.cursor()
     cur.execute(
@@ -237,15 +455,14 @@ def get_study_card(card_id: int) -> Optional[Dict[str, Any]]:
         (int(card_id),),
     )
     row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+    return _RowView(row) if row else None
 
 
 def list_study_cards(
     q: str = "",
     document_id: Optional[int] = None,
     limit: int = 200,
-) -> List[Dict[str, Any]]:
+) -> List[_RowView]:
     q2 = f"%{(q or '').strip()}%"
     conn = get_conn()
     cur = conn.cursor()
@@ -267,14 +484,43 @@ def list_study_cards(
     LEFT JOIN documents d ON d.id=c.document_id
     LEFT JOIN study_srs s ON s.card_id=c.id
     {where_sql}
-    ORDER BY date(s.due_at) ASC, s.box ASC, c.id DESC
+    ORDER BY s.due_at ASC, s.box ASC, c.id DESC
     LIMIT ?
     """,
         (*args, int(limit)),
     )
     rows = cur.fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    return [_RowView(r) for r in rows]
+
+
+def iter_study_cards_export(document_id: Optional[int] = None, limit: int = 5000) -> Iterator[sqlite3.Row]:
+    """Cards in list_study_cards order, fetched lazily for streaming exports.
+
+    Uses its own connection: a streaming response resumes the generator on whichever
+    threadpool worker is free, so the thread-local one can't be held across yields.
+    """
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            f"""
+        SELECT c.id, d.title AS document_title, s.box, s.due_at, c.question, c.answer
+        FROM study_cards c
+        LEFT JOIN documents d ON d.id=c.document_id
+        LEFT JOIN study_srs s ON s.card_id=c.id
+        {"" if document_id is None else "WHERE c.document_id=?"}
+        ORDER BY s.due_at ASC, s.box ASC, c.id DESC
+        LIMIT ?
+        """,
+            (*(() if document_id is None else (int(document_id),)), int(limit)),
+        )
+        while True:
+            rows = cur.fetchmany(256)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
 
 
 def get_study_counts(document_id: Optional[int] = None) -> Tuple[int, int]:
@@ -283,7 +529,7 @@ def get_study_counts(document_id: Optional[int] = None) -> Tuple[int, int]:
     if document_id is None:
         cur.execute("SELECT COUNT(*) AS n FROM study_cards")
         total = int(cur.fetchone()["n"])
-        cur.execute("SELECT COUNT(*) AS n FROM study_srs WHERE date(due_at) <= date('now')")
+        cur.execute("SELECT COUNT(*) AS n FROM study_srs WHERE due_at <= date('now')")
         due = int(cur.fetchone()["n"])
     else:
         cur.execute("SELECT COUNT(*) AS n FROM study_cards WHERE document_id=?", (int(document_id),))
@@ -293,16 +539,15 @@ def get_study_counts(document_id: Optional[int] = None) -> Tuple[int, int]:
         SELECT COUNT(*) AS n
         FROM study_srs s
         JOIN study_cards c ON c.id=s.card_id
-        WHERE c.document_id=? AND date(s.due_at) <= date('now')
+        WHERE c.document_id=? AND s.due_at <= date('now')
         """,
             (int(document_id),),
         )
         due = int(cur.fetchone()["n"])
-    conn.close()
     return total, due
 
 
-def get_next_due_card(document_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+def get_next_due_card(document_id: Optional[int] = None) -> Optional[_RowView]:
     conn = get_conn()
     cur = conn.cursor()
     if document_id is None:
@@ -312,8 +557,8 @@ def get_next_due_card(document_id: Optional[int] = None) -> Optional[Dict[str, A
         FROM study_srs s
         JOIN study_cards c ON c.id=s.card_id
         LEFT JOIN documents d ON d.id=c.document_id
-        WHERE date(s.due_at) <= date('now')
-        ORDER BY date(s.due_at) ASC, s.box ASC, c.id ASC
+        WHERE s.due_at <= date('now')
+        ORDER BY s.due_at ASC, s.box ASC, s.card_id ASC
         LIMIT 1
         """
         )
@@ -324,18 +569,17 @@ def get_next_due_card(document_id: Optional[int] = None) -> Optional[Dict[str, A
         FROM study_srs s
         JOIN study_cards c ON c.id=s.card_id
         LEFT JOIN documents d ON d.id=c.document_id
-        WHERE c.document_id=? AND date(s.due_at) <= date('now')
-        ORDER BY date(s.due_at) ASC, s.box ASC, c.id ASC
+        WHERE c.document_id=? AND s.due_at <= date('now')
+        ORDER BY s.due_at ASC, s.box ASC, s.card_id ASC
         LIMIT 1
         """,
             (int(document_id),),
         )
     row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+    return _RowView(row) if row else None
 
 
-def get_random_card(document_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+def get_random_card(document_id: Optional[int] = None) -> Optional[_RowView]:
     """Returns a random card (useful for practice mode when nothing is due)."""
     conn = get_conn()
     cur = conn.cursor()
@@ -364,8 +608,40 @@ def get_random_card(document_id: Optional[int] = None) -> Optional[Dict[str, Any
             , (int(document_id),)
         )
     row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+    return _RowView(row) if row else None
+
+
+def _sample_answers(cur: sqlite3.Cursor, exclude_card_id: int, document_id: Optional[int], k: int) -> List[str]:
+    """Up to k answers of random cards, found by probing random ids in [MIN(id), MAX(id)].
+
+    A handful of primary-key lookups instead of ORDER BY RANDOM() sorting the whole
+    table; falls back to the sort when ids are too sparse for the probes to hit k cards.
+    """
+    where_sql = "id != ?"
+    args: List[Any] = [int(exclude_card_id)]
+    if document_id is not None:
+        where_sql += " AND document_id=?"
+        args.append(int(document_id))
+
+    if document_id is None:
+        cur.execute("SELECT MIN(id) AS lo, MAX(id) AS hi FROM study_cards")
+    else:
+        cur.execute("SELECT MIN(id) AS lo, MAX(id) AS hi FROM study_cards WHERE document_id=?", (int(document_id),))
+    row = cur.fetchone()
+    if row is None or row["lo"] is None:
+        return []
+    lo, hi = int(row["lo"]), int(row["hi"])
+
+    probes = random.sample(range(lo, hi + 1), min(hi - lo + 1, 10 * k))
+    qs = ",".join(["?"] * len(probes))
+    cur.execute(f"SELECT answer FROM study_cards WHERE {where_sql} AND id IN ({qs})", (*args, *probes))
+    out = [r["answer"] for r in cur.fetchall()]
+    if len(out) < k:
+        cur.execute(f"SELECT answer FROM study_cards WHERE {where_sql} ORDER BY RANDOM() LIMIT ?", (*args, int(k)))
+        return [r["answer"] for r in cur.fetchall()]
+    # IN (...) comes back in id order
+    random.shuffle(out)
+    return out[:k]
 
 
 def get_random_distractors(
@@ -379,30 +655,11 @@ def get_random_distractors(
     out: List[str] = []
 
     if document_id is not None:
-        cur.execute(
-            """
-        SELECT answer FROM study_cards
-        WHERE id != ? AND document_id=?
-        ORDER BY RANDOM()
-        LIMIT ?
-        """,
-            (int(exclude_card_id), int(document_id), int(k)),
-        )
-        out = [r["answer"] for r in cur.fetchall()]
+        out = _sample_answers(cur, exclude_card_id, document_id, k)
 
     if len(out) < k:
-        cur.execute(
-            """
-        SELECT answer FROM study_cards
-        WHERE id != ?
-        ORDER BY RANDOM()
-        LIMIT ?
-        """,
-            (int(exclude_card_id), int(k - len(out))),
-        )
-        out.extend([r["answer"] for r in cur.fetchall()])
+        out.extend(_sample_answers(cur, exclude_card_id, None, k - len(out)))
 
-    conn.close()
     # unique, keep order
     seen = set()
     uniq = []
@@ -414,10 +671,8 @@ def get_random_distractors(
     return uniq[:k]
 
 
-def review_card(card_id: int, correct: bool, source: str = "session") -> None:
-    """Updates SRS (Leitner) + logs a review."""
-    conn = get_conn()
-    cur = conn.cursor()
+def _apply_review(cur: sqlite3.Cursor, card_id: int, correct: bool, source: str) -> None:
+    """Leitner step + review log for one answer, inside the caller's transaction."""
     cur.execute("SELECT box, correct_streak FROM study_srs WHERE card_id=?", (int(card_id),))
     row = cur.fetchone()
     if not row:
@@ -462,8 +717,62 @@ def review_card(card_id: int, correct: bool, source: str = "session") -> None:
     """,
         (int(card_id), 1 if correct else 0, (source or "session")),
     )
-    conn.commit()
-    conn.close()
+
+
+# Group commit for reviews: answers arriving while a batch is being written are
+# queued and then written together in one transaction (one fsync for the lot).
+# Callers still wait for their own review, so the next card is picked from
+# up-to-date SRS state; an idle writer adds no delay.
+_REVIEW_BATCH_MAX = 32
+_REVIEW_Q: "queue.Queue[tuple]" = queue.Queue()
+_REVIEW_WRITER: Optional[threading.Thread] = None
+_REVIEW_WRITER_LOCK = threading.Lock()
+
+
+def _review_writer() -> None:
+    while True:
+        batch = [_REVIEW_Q.get()]
+        while len(batch) < _REVIEW_BATCH_MAX:
+            try:
+                batch.append(_REVIEW_Q.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            with tx() as cur:
+                for card_id, correct, source, _fut in batch:
+                    _apply_review(cur, card_id, correct, source)
+        except Exception:
+            # one bad review (e.g. a deleted card) must not fail the others
+            for card_id, correct, source, fut in batch:
+                try:
+                    with tx() as cur:
+                        _apply_review(cur, card_id, correct, source)
+                except Exception as e:
+                    fut.set_exception(e)
+                else:
+                    fut.set_result(None)
+        else:
+            for *_, fut in batch:
+                fut.set_result(None)
+
+
+def review_card(card_id: int, correct: bool, source: str = "session") -> None:
+    """Updates SRS (Leitner) + logs a review."""
+    global _REVIEW_WRITER
+    if getattr(_tls, "tx_depth", 0):
+        # inside a caller's tx(): the writer thread would wait on our write lock
+        _apply_review(get_conn().cursor(), int(card_id), bool(correct), source)
+        return
+
+    if _REVIEW_WRITER is None:
+        with _REVIEW_WRITER_LOCK:
+            if _REVIEW_WRITER is None:
+                _REVIEW_WRITER = threading.Thread(target=_review_writer, name="review-writer", daemon=True)
+                _REVIEW_WRITER.start()
+
+    fut: Future = Future()
+    _REVIEW_Q.put((int(card_id), bool(correct), source, fut))
+    fut.result()
 
 
 def study_stats(document_id: Optional[int] = None) -> Dict[str, Any]:
@@ -517,7 +826,7 @@ def study_stats(document_id: Optional[int] = None) -> Dict[str, Any]:
     LEFT JOIN documents d ON d.id=c.document_id
     LEFT JOIN study_srs s ON s.card_id=c.id
     WHERE s.box=1
-    ORDER BY date(s.due_at) ASC, c.id DESC
+    ORDER BY s.due_at ASC, c.id DESC
     LIMIT 12
     """
         )
@@ -530,55 +839,63 @@ def study_stats(document_id: Optional[int] = None) -> Dict[str, Any]:
     LEFT JOIN documents d ON d.id=c.document_id
     LEFT JOIN study_srs s ON s.card_id=c.id
     WHERE s.box=1 AND c.document_id=?
-    ORDER BY date(s.due_at) ASC, c.id DESC
+    ORDER BY s.due_at ASC, c.id DESC
     LIMIT 12
     """,
             (int(document_id),),
         )
-    weak = [dict(r) for r in cur.fetchall()]
+    weak = [_RowView(r) for r in cur.fetchall()]
 
-    conn.close()
     return {"total": total, "due": due, "dist": dist, "acc": acc, "weak": weak}
 
 
-def _set_default(cur: sqlite3.Cursor, key: str, value: str) -> None:
-    cur.execute("SELECT value FROM settings WHERE key = ?", (key,))
-    row = cur.fetchone()
-    if row is None:
-        cur.execute("INSERT INTO settings(key, value) VALUES(?, ?)", (key, value))
+# ---------- settings ----------
+# Settings are read on every rendered page and written only from the settings form, so
+# readers share one snapshot per version; set_setting bumps the version after commit.
+_SETTINGS_VER = 0
+_SETTINGS_VER_LOCK = threading.Lock()
 
 
-# ---------- settings ----------
-def get_all_settings() -> Dict[str, str]:
+def _bump_settings_version() -> None:
+    global _SETTINGS_VER
+    with _SETTINGS_VER_LOCK:
+        _SETTINGS_VER += 1
+
+
+@functools.lru_cache(maxsize=1)
+def _all_settings_v(ver: int) -> Dict[str, str]:
     conn = get_conn()
     cur = conn.cursor()
     cur.execute("SELECT key, value FROM settings")
     rows = cur.fetchall()
-    conn.close()
     return {r["key"]: r["value"] for r in rows}
 
 
+def _settings_snapshot() -> Dict[str, str]:
+    if getattr(_tls, "tx_depth", 0):
+        # uncommitted writes of this transaction are not in the snapshot yet
+        return _all_settings_v.__wrapped__(_SETTINGS_VER)
+    return _all_settings_v(_SETTINGS_VER)
+
+
+def get_all_settings() -> Dict[str, str]:
+    return dict(_settings_snapshot())
+
+
 def get_setting(key: str, default: str = "") -> str:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT value FROM settings WHERE key = ?", (key,))
-    row = cur.fetchone()
-    conn.close()
-    return row["value"] if row else default
+    return _settings_snapshot().get(key, default)
 
 
 def set_setting(key: str, value: str) -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-    INSERT INTO settings(key, value) VALUES(?, ?)
-    ON CONFLICT(key) DO UPDATE SET value=excluded.value
-    """,
-        (key, value),
-    )
-    conn.commit()
-    conn.close()
+    with tx() as cur:
+        cur.execute(
+            """
+        INSERT INTO settings(key, value) VALUES(?, ?)
+        ON CONFLICT(key) DO UPDATE SET value=excluded.value
+        """,
+            (key, value),
+        )
+    _after_commit(_bump_settings_version)
 
 
 # ---------- documents ----------
@@ -590,45 +907,70 @@ def insert_document(
     pages: int,
     doc_type: str,
     search_text: str,
+    status: str = "ready",
 ) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-    INSERT INTO documents(title, original_name, stored_name, language, pages, doc_type, search_text)
-    VALUES(?,?,?,?,?,?,?)
-    """,
-        (title, original_name, stored_name, language, int(pages), doc_type, search_text),
-    )
-    conn.commit()
+    """status='writing' marks a row whose file is still being written to uploads/."""
+    with tx() as cur:
+        cur.execute(
+            """
+        INSERT INTO documents(title, original_name, stored_name, language, pages, doc_type, search_text, status)
+        VALUES(?,?,?,?,?,?,?,?)
+        """,
+            (title, original_name, stored_name, language, int(pages), doc_type, search_text, status),
+        )
+    _after_commit(_bump_documents_version)
     doc_id = cur.lastrowid
-    conn.close()
     return int(doc_id)
 
 
-def existing_study_card_keys(document_ids: List[Optional[int]]) -> set[tuple[Optional[int], str, str]]:
-    """Return a set of (document_id, question, answer) for dedup checks."""
-    doc_ids = list(document_ids or [])
-    want_null = any(d is None for d in doc_ids)
-    ids = [int(d) for d in doc_ids if d is not None]
+def set_document_status(doc_id: int, status: str) -> None:
+    with tx() as cur:
+        cur.execute("UPDATE documents SET status=? WHERE id=?", (status, int(doc_id)))
+    _after_commit(_bump_documents_version)
 
-    conn = get_conn()
-    cur = conn.cursor()
-    keys: set[tuple[Optional[int], str, str]] = set()
 
-    if want_null:
-        cur.execute("SELECT document_id, question, answer FROM study_cards WHERE document_id IS NULL")
-        for r in cur.fetchall():
-            keys.add((None, r["question"], r["answer"]))
+def study_card_key(document_id: Optional[int], question: str, answer: str) -> bytes:
+    """16-byte digest of a card's dedup identity (NULL doc distinct from any id).
 
-    if ids:
-        qs = ",".join(["?"] * len(ids))
-        cur.execute(f"SELECT document_id, question, answer FROM study_cards WHERE document_id IN ({qs})", ids)
-        for r in cur.fetchall():
-            keys.add((int(r["document_id"]), r["question"], r["answer"]))
+    Sets of these stay small and cheap to probe even for multi-KB questions/answers.
+    """
+    doc = "" if document_id is None else str(int(document_id))
+    return hashlib.blake2b(f"{doc}\0{question}\0{answer}".encode("utf-8"), digest_size=16).digest()
 
-    conn.close()
-    return keys
+
+def existing_study_card_flags(rows: List[Tuple[Optional[int], str, str]]) -> List[bool]:
+    """For each (document_id, question, answer): is that card already stored?
+
+    The candidates go into a TEMP table and are classified by one query that probes
+    idx_study_cards_uniq per row, instead of pulling every stored card into Python.
+    """
+    if not rows:
+        return []
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS preview_cards(idx INTEGER PRIMARY KEY, doc_id INTEGER, q TEXT, a TEXT)")
+    cur.execute("DELETE FROM preview_cards")
+    cur.executemany(
+        "INSERT INTO preview_cards(idx, doc_id, q, a) VALUES(?,?,?,?)",
+        ((i, d, q, a) for i, (d, q, a) in enumerate(rows)),
+    )
+    cur.execute(
+        """
+    SELECT p.idx, EXISTS(
+             SELECT 1 FROM study_cards s
+             WHERE COALESCE(s.document_id, -1) = COALESCE(p.doc_id, -1)
+               AND s.question = p.q AND s.answer = p.a
+           )
+    FROM preview_cards p
+    """
+    )
+    flags = [False] * len(rows)
+    for idx, dup in cur.fetchall():
+        flags[idx] = bool(dup)
+    # the temp-table writes opened an implicit transaction; don't leave it hanging
+    if not getattr(_tls, "tx_depth", 0):
+        conn.commit()
+    return flags
 
 
 def study_stats_by_document() -> List[Dict[str, Any]]:
@@ -641,7 +983,7 @@ def study_stats_by_document() -> List[Dict[str, Any]]:
     SELECT d.id AS document_id,
            d.title AS document_title,
            COUNT(c.id) AS total,
-           COALESCE(SUM(CASE WHEN date(s.due_at) <= date('now') THEN 1 ELSE 0 END), 0) AS due
+           COALESCE(SUM(CASE WHEN s.due_at <= date('now') THEN 1 ELSE 0 END), 0) AS due
     FROM documents d
     LEFT JOIN study_cards c ON c.document_id = d.id
     LEFT JOIN study_srs s ON s.card_id = c.id
@@ -668,7 +1010,6 @@ def study_stats_by_document() -> List[Dict[str, Any]]:
     for r in cur.fetchall():
         acc_map[int(r["document_id"])] = {"correct": int(r["correct"] or 0), "n": int(r["n"] or 0)}
 
-    conn.close()
 
     out: List[Dict[str, Any]] = []
     for row in rows:
@@ -690,69 +1031,100 @@ def study_stats_by_document() -> List[Dict[str, Any]]:
     return out
 
 
-def _doc_postprocess(d: Dict[str, Any]) -> Dict[str, Any]:
-    # Backwards-compat aliases for templates
-    if "doc_type" in d and "type" not in d:
-        d["type"] = d.get("doc_type")
-    if "pages" in d and "page_count" not in d:
-        d["page_count"] = d.get("pages")
-    return d
+# Nearly every page renders the document dropdown; the list only changes through
+# insert_document, which bumps this version after its commit.
+_DOCS_VER = 0
+_DOCS_VER_LOCK = threading.Lock()
+
+
+def _bump_documents_version() -> None:
+    global _DOCS_VER
+    with _DOCS_VER_LOCK:
+        _DOCS_VER += 1
+
 
+# Everything but search_text (the extracted PDF body): listings only show metadata.
+_DOC_META_COLS = "id, title, original_name, stored_name, language, pages, doc_type, status, created_at"
 
-def list_documents() -> List[Dict[str, Any]]:
+
+@functools.lru_cache(maxsize=1)
+def _list_documents_v(ver: int) -> Tuple[_DocRowView, ...]:
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("SELECT * FROM documents ORDER BY id DESC")
+    cur.execute(f"SELECT {_DOC_META_COLS} FROM documents ORDER BY id DESC")
     rows = cur.fetchall()
-    conn.close()
-    return [_doc_postprocess(dict(r)) for r in rows]
+    return tuple(_DocRowView(r) for r in rows)
+
+
+def list_documents_meta() -> List[_DocRowView]:
+    """All documents without search_text, newest first. Rows are shared between callers: read-only."""
+    return list(_list_documents_v(_DOCS_VER))
+
 
+def list_documents(limit: Optional[int] = None) -> List[_DocRowView]:
+    """Full document rows (including search_text), newest first."""
+    conn = get_conn()
+    cur = conn.cursor()
+    if limit is None:
+        cur.execute("SELECT * FROM documents ORDER BY id DESC")
+    else:
+        cur.execute("SELECT * FROM documents ORDER BY id DESC LIMIT ?", (int(limit),))
+    return [_DocRowView(r) for r in cur.fetchall()]
 
-def get_document(doc_id: int) -> Optional[Dict[str, Any]]:
+
+def get_document(doc_id: int) -> Optional[_DocRowView]:
     conn = get_conn()
     cur = conn.cursor()
     cur.execute("SELECT * FROM documents WHERE id = ?", (int(doc_id),))
     row = cur.fetchone()
-    conn.close()
-    return _doc_postprocess(dict(row)) if row else None
+    return _DocRowView(row) if row else None
 
 
-def search_documents(q: str, limit: int = 8) -> List[Dict[str, Any]]:
+def search_documents(q: str, limit: int = 8) -> List[_DocRowView]:
     q2 = f"%{(q or '').strip()}%"
+    phrase = _fts_phrase(q)
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute(
-        """
-    SELECT * FROM documents
-    WHERE title LIKE ? OR search_text LIKE ? OR original_name LIKE ?
-    ORDER BY id DESC
-    LIMIT ?
-    """,
-        (q2, q2, q2, int(limit)),
-    )
+    if phrase is not None:
+        cur.execute(
+            """
+        SELECT d.* FROM documents_fts f
+        JOIN documents d ON d.id=f.rowid
+        WHERE documents_fts MATCH ?
+        ORDER BY f.rank
+        LIMIT ?
+        """,
+            (phrase, int(limit)),
+        )
+    else:
+        cur.execute(
+            """
+        SELECT * FROM documents
+        WHERE title LIKE ? OR search_text LIKE ? OR original_name LIKE ?
+        ORDER BY id DESC
+        LIMIT ?
+        """,
+            (q2, q2, q2, int(limit)),
+        )
     rows = cur.fetchall()
-    conn.close()
-    return [_doc_postprocess(dict(r)) for r in rows]
+    return [_DocRowView(r) for r in rows]
 
 
 # ---------- notes ----------
 def insert_note(title: str, body: str, document_id: Optional[int] = None) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-    INSERT INTO notes(title, body, document_id)
-    VALUES(?,?,?)
-    """,
-        (title, body, document_id),
-    )
-    conn.commit()
+    with tx() as cur:
+        cur.execute(
+            """
+        INSERT INTO notes(title, body, document_id)
+        VALUES(?,?,?)
+        """,
+            (title, body, document_id),
+        )
     nid = cur.lastrowid
-    conn.close()
     return int(nid)
 
 
-def list_notes(limit: int = 50, document_id: Optional[int] = None) -> List[Dict[str, Any]]:
+def list_notes(limit: int = 50, document_id: Optional[int] = None) -> List[_RowView]:
     conn = get_conn()
     cur = conn.cursor()
     if document_id is None:
@@ -775,46 +1147,61 @@ def list_notes(limit: int = 50, document_id: Optional[int] = None) -> List[Dict[
             (int(document_id), int(limit)),
         )
     rows = cur.fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    return [_RowView(r) for r in rows]
 
 
-def get_note(note_id: int) -> Optional[Dict[str, Any]]:
+def get_note(note_id: int) -> Optional[_RowView]:
     conn = get_conn()
     cur = conn.cursor()
     cur.execute("SELECT * FROM notes WHERE id = ?", (int(note_id),))
     row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+    return _RowView(row) if row else None
 
 
 def update_note(note_id: int, title: str, body: str, document_id: Optional[int]) -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-    UPDATE notes SET title=?, body=?, document_id=? WHERE id=?
-    """,
-        (title, body, document_id, int(note_id)),
-    )
-    conn.commit()
-    conn.close()
+    with tx() as cur:
+        cur.execute(
+            """
+        UPDATE notes SET title=?, body=?, document_id=? WHERE id=?
+        """,
+            (title, body, document_id, int(note_id)),
+        )
 
 
 def delete_note(note_id: int) -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM notes WHERE id=?", (int(note_id),))
-    conn.commit()
-    conn.close()
+    with tx() as cur:
+        cur.execute("DELETE FROM notes WHERE id=?", (int(note_id),))
 
 
-def search_notes(q: str, document_id: Optional[int] = None, limit: int = 12) -> List[Dict[str, Any]]:
+def search_notes(q: str, document_id: Optional[int] = None, limit: int = 12) -> List[_RowView]:
     q2 = f"%{(q or '').strip()}%"
+    phrase = _fts_phrase(q)
     conn = get_conn()
     cur = conn.cursor()
 
-    if document_id is None:
+    if phrase is not None and document_id is None:
+        cur.execute(
+            """
+        SELECT n.* FROM notes_fts f
+        JOIN notes n ON n.id=f.rowid
+        WHERE notes_fts MATCH ?
+        ORDER BY f.rank
+        LIMIT ?
+        """,
+            (phrase, int(limit)),
+        )
+    elif phrase is not None:
+        cur.execute(
+            """
+        SELECT n.* FROM notes_fts f
+        JOIN notes n ON n.id=f.rowid
+        WHERE notes_fts MATCH ? AND n.document_id=?
+        ORDER BY f.rank
+        LIMIT ?
+        """,
+            (phrase, int(document_id), int(limit)),
+        )
+    elif document_id is None:
         cur.execute(
             """
         SELECT * FROM notes
@@ -836,5 +1223,4 @@ def search_notes(q: str, document_id: Optional[int] = None, limit: int = 12) ->
         )
 
     rows = cur.fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    return [_RowView(r) for r in rows]
@@ -3,10 +3,17 @@ from __future__ import annotations
 
 import hashlib
 import io
+import json
+import mmap
 import os
 import random
+import threading
 import time
 import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from urllib.parse import quote_plus
 
@@ -30,8 +37,10 @@ from reportlab.pdfgen import canvas
 from db import (
     init_db,
     list_documents,
+    list_documents_meta,
     get_document,
     insert_document,
+    set_document_status,
     search_documents,
     list_notes,
     get_note,
@@ -43,6 +52,7 @@ from db import (
     set_setting,
     # Study
     create_study_card,
+    create_study_cards_bulk,
     update_study_card,
     delete_study_card,
     get_study_card,
@@ -53,7 +63,9 @@ from db import (
     get_random_distractors,
     review_card,
     study_stats,
-    existing_study_card_keys,
+    existing_study_card_flags,
+    study_card_key,
+    iter_study_cards_export,
     study_stats_by_document,
 )
 from tools import (
@@ -82,24 +94,88 @@ UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 
-# In-memory preview cache for Study generation (no auth/session yet)
-STUDY_PREVIEW_CACHE: Dict[str, Dict[str, Any]] = {}
+# In-memory preview cache for Study generation (no auth/session yet).
+# Insertion order == creation order, so expired entries are always at the front.
+# Items are kept as zlib-compressed JSON (repetitive Q/A text shrinks several-fold),
+# and the cache is capped so a burst of abandoned previews can't grow it unbounded.
+STUDY_PREVIEW_CACHE: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_PREVIEW_CACHE_MAX = 256
+_PREVIEW_TTL_S = 3600
+_PREVIEW_MAX_ITEMS = 350  # cards shown in one preview
+_PREVIEW_CACHE_LOCK = threading.Lock()  # sync handlers run on several threadpool workers
 
 def _preview_cache_put(items: List[Dict[str, Any]]) -> str:
     token = uuid.uuid4().hex
-    STUDY_PREVIEW_CACHE[token] = {"created_at": time.time(), "items": items}
-    # cleanup old previews (1h)
-    now = time.time()
-    for k, v in list(STUDY_PREVIEW_CACHE.items()):
-        if now - float(v.get("created_at", 0) or 0) > 3600:
-            STUDY_PREVIEW_CACHE.pop(k, None)
+    payload = zlib.compress(json.dumps(items, ensure_ascii=False).encode("utf-8"), 3)
+    now = time.monotonic()
+    with _PREVIEW_CACHE_LOCK:
+        STUDY_PREVIEW_CACHE[token] = {"created_at": now, "items": payload}
+        # cleanup old previews (1h): pop from the oldest end until a fresh one
+        while STUDY_PREVIEW_CACHE:
+            v = next(iter(STUDY_PREVIEW_CACHE.values()))
+            if now - v["created_at"] <= _PREVIEW_TTL_S and len(STUDY_PREVIEW_CACHE) <= _PREVIEW_CACHE_MAX:
+                break
+            STUDY_PREVIEW_CACHE.popitem(last=False)
     return token
 
 def _preview_cache_pop(token: str) -> Optional[List[Dict[str, Any]]]:
-    v = STUDY_PREVIEW_CACHE.pop(token, None)
-    if not v:
+    with _PREVIEW_CACHE_LOCK:
+        v = STUDY_PREVIEW_CACHE.pop(token, None)
+    if not v or time.monotonic() - v["created_at"] > _PREVIEW_TTL_S:
         return None
-    return v.get("items")
+    return json.loads(zlib.decompress(v["items"]))
+
+
+# extract_qa_pairs results keyed by a digest of the text: previews regenerate from the
+# same note bodies / document texts over and over. LRU-bounded, pairs only (no text).
+_QA_CACHE: "OrderedDict[bytes, tuple]" = OrderedDict()
+_QA_CACHE_MAX = 512
+_QA_CACHE_LOCK = threading.Lock()
+
+def _cached_qa_pairs(text: str) -> tuple:
+    key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+    with _QA_CACHE_LOCK:
+        pairs = _QA_CACHE.get(key)
+        if pairs is not None:
+            _QA_CACHE.move_to_end(key)
+            return pairs
+    pairs = tuple(extract_qa_pairs(text))
+    _qa_cache_store(key, pairs)
+    return pairs
+
+
+def _qa_cache_store(key: bytes, pairs: tuple) -> None:
+    with _QA_CACHE_LOCK:
+        _QA_CACHE[key] = pairs
+        if len(_QA_CACHE) > _QA_CACHE_MAX:
+            _QA_CACHE.popitem(last=False)
+
+
+# extract_qa_pairs is pure-Python regex work (GIL-bound): several large document texts
+# are spread over worker processes. Workers start on first use.
+_QA_POOL = ProcessPoolExecutor(max_workers=min(8, os.cpu_count() or 2))
+
+
+def _cached_qa_pairs_many(texts: List[str]) -> List[tuple]:
+    """_cached_qa_pairs for several texts; cache misses are extracted in parallel."""
+    keys = [hashlib.blake2b(t.encode("utf-8"), digest_size=16).digest() for t in texts]
+    out: List[Optional[tuple]] = []
+    with _QA_CACHE_LOCK:
+        for key in keys:
+            pairs = _QA_CACHE.get(key)
+            if pairs is not None:
+                _QA_CACHE.move_to_end(key)
+            out.append(pairs)
+
+    missing = [i for i, pairs in enumerate(out) if pairs is None]
+    if len(missing) > 1:
+        results = _QA_POOL.map(extract_qa_pairs, [texts[i] for i in missing])
+    else:
+        results = map(extract_qa_pairs, [texts[i] for i in missing])
+    for i, pairs in zip(missing, results):
+        out[i] = tuple(pairs)
+        _qa_cache_store(keys[i], out[i])
+    return out
 
 
 # static (css, js, etc.)
@@ -112,6 +188,13 @@ def _startup():
     UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 
+@app.on_event("shutdown")
+def _shutdown():
+    _QA_POOL.shutdown(wait=False, cancel_futures=True)
+    # let queued uploads/ writes land, otherwise their rows stay status='writing'
+    _WRITE_POOL.shutdown(wait=True)
+
+
 def _settings_context() -> dict:
     """Templates can use: s.answer_language, s.theme, etc."""
     s = get_all_settings() or {}
@@ -121,6 +204,19 @@ def _settings_context() -> dict:
     return {"s": s2}
 
 
+@contextmanager
+def _mapped_pdf(fp: Path):
+    """Read-only mmap of a stored PDF (b"" for an empty file, which mmap refuses)."""
+    with fp.open("rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            yield b""
+            return
+        with mm:
+            yield mm
+
+
 def _parse_doc_ids(text_value: str):
     """Parse comma-separated doc ids: "1,2,3" -> [1,2,3]."""
     raw = (text_value or "").strip()
@@ -146,20 +242,43 @@ def _parse_doc_ids(text_value: str):
     return uniq
 
 
+# Generated PDFs can be written off the request path: the row is inserted first with
+# status='writing' and flipped to 'ready' once the file has landed.
+_WRITE_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pdf-write")
+
+
+def _write_document_file(doc_id: int, target: Path, data: bytes) -> None:
+    # write + rename: a file that exists under its stored name is always complete
+    tmp = target.with_name(target.name + ".part")
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, target)
+    except Exception:
+        tmp.unlink(missing_ok=True)
+        set_document_status(doc_id, "error")
+        raise
+    set_document_status(doc_id, "ready")
+
+
 def _store_pdf_bytes_as_document(
     pdf_bytes: bytes,
     *,
     title: str,
     original_name: str,
     language: str = "auto",
+    background: bool = False,
 ) -> int:
-    """Save generated PDF into uploads/ + insert into documents table."""
+    """Save generated PDF into uploads/ + insert into documents table.
+
+    background=True returns right after the insert and writes the file on _WRITE_POOL.
+    """
     safe_orig = safe_filename(original_name, "document.pdf")
     raw = (safe_orig + str(os.urandom(8))).encode("utf-8", "ignore")
     h = hashlib.sha256(raw).hexdigest()[:24]
     stored_name = f"{h}_{safe_orig}"
 
-    (UPLOAD_DIR / stored_name).write_bytes(pdf_bytes)
+    if not background:
+        (UPLOAD_DIR / stored_name).write_bytes(pdf_bytes)
 
     try:
         pages = pdf_page_count(pdf_bytes)
@@ -171,7 +290,7 @@ def _store_pdf_bytes_as_document(
     except Exception:
         search_text = ""
 
-    return insert_document(
+    doc_id = insert_document(
         title=title,
         original_name=original_name,
         stored_name=stored_name,
@@ -179,7 +298,21 @@ def _store_pdf_bytes_as_document(
         pages=pages,
         doc_type="pdf",
         search_text=search_text,
+        status="writing" if background else "ready",
     )
+    if background:
+        _WRITE_POOL.submit(_write_document_file, doc_id, UPLOAD_DIR / stored_name, pdf_bytes)
+    return doc_id
+
+
+def _file_not_ready(doc) -> Optional[PlainTextResponse]:
+    """503 while a generated file is still being written (clients retry), 500 if it failed."""
+    status = doc.get("status") or "ready"
+    if status == "writing":
+        return PlainTextResponse("File is still being written", status_code=503, headers={"Retry-After": "1"})
+    if status == "error":
+        return PlainTextResponse("File could not be written", status_code=500)
+    return None
 
 
 # ---------------- Home / Onboarding ----------------
@@ -200,7 +333,7 @@ def onboarding(request: Request):
 # ---------------- Documents ----------------
 @app.get("/documents", response_class=HTMLResponse)
 def documents_page(request: Request):
-    docs = list_documents()
+    docs = list_documents_meta()
     ctx = {"request": request, "docs": docs}
     ctx.update(_settings_context())
     return templates.TemplateResponse("documents.html", ctx)
@@ -270,6 +403,10 @@ def document_file(doc_id: int):
     if not doc:
         return PlainTextResponse("Not found", status_code=404)
 
+    not_ready = _file_not_ready(doc)
+    if not_ready is not None:
+        return not_ready
+
     fp = UPLOAD_DIR / (doc.get("stored_name") or "")
     if not fp.exists():
         return PlainTextResponse("File missing", status_code=404)
@@ -291,6 +428,10 @@ def document_download(doc_id: int):
     if not doc:
         return PlainTextResponse("Not found", status_code=404)
 
+    not_ready = _file_not_ready(doc)
+    if not_ready is not None:
+        return not_ready
+
     fp = UPLOAD_DIR / (doc.get("stored_name") or "")
     if not fp.exists():
         return PlainTextResponse("File missing", status_code=404)
@@ -308,7 +449,7 @@ def document_download(doc_id: int):
 # ---------------- Notes ----------------
 @app.get("/notes", response_class=HTMLResponse)
 def notes_page(request: Request, doc: str = ""):
-    docs = list_documents()
+    docs = list_documents_meta()
 
     doc_selected = None
     if (doc or "").strip():
@@ -340,7 +481,7 @@ def note_new_page(request: Request, doc: str = ""):
 
     ctx = {
         "request": request,
-        "docs": list_documents(),
+        "docs": list_documents_meta(),
         "mode": "new",
         "note": {"title": "", "body": "", "document_id": doc_selected},
     }
@@ -397,7 +538,7 @@ def note_edit_page(request: Request, note_id: int):
     ctx = {
         "request": request,
         "note": note,
-        "docs": list_documents(),
+        "docs": list_documents_meta(),
         "mode": "edit",
     }
     ctx.update(_settings_context())
@@ -507,7 +648,7 @@ def note_export_pdf(note_id: int):
 # ---------------- Ask ----------------
 @app.get("/ask", response_class=HTMLResponse)
 def ask_get(request: Request, q: str = "", scope: str = "all", doc: str = ""):
-    docs_list = list_documents()
+    docs_list = list_documents_meta()
 
     doc_id_val = None
     if (doc or "").strip():
@@ -629,7 +770,7 @@ def _render_pdf_tools(
     """Consistent PDF Tools page rendering with basic UX feedback."""
     ctx = {
         "request": request,
-        "docs": list_documents(),
+        "docs": list_documents_meta(),
         "result": result,
         "result_kind": result_kind,
         "created_docs": created_docs or [],
@@ -970,7 +1111,8 @@ def pdf_tools_extract_pages(request: Request, doc_id: int = Form(...), ranges_te
         )
 
     try:
-        out = extract_pages_pdf_bytes(fp.read_bytes(), ranges)
+        with _mapped_pdf(fp) as data:
+            out = extract_pages_pdf_bytes(data, ranges)
     except Exception as e:
         return _render_pdf_tools(
             request,
@@ -982,7 +1124,9 @@ def pdf_tools_extract_pages(request: Request, doc_id: int = Form(...), ranges_te
 
     original_out = f"extract_{doc.get('original_name','document.pdf')}"
     title_out = f"Extract — {doc.get('title') or doc.get('original_name','PDF')}"
-    new_id = _store_pdf_bytes_as_document(out, title=title_out, original_name=original_out, language=doc.get("language") or "auto")
+    new_id = _store_pdf_bytes_as_document(
+        out, title=title_out, original_name=original_out, language=doc.get("language") or "auto", background=True
+    )
     new_doc = get_document(new_id)
 
     return _render_pdf_tools(
@@ -1016,47 +1160,50 @@ def pdf_tools_reorder(request: Request, doc_id: int = Form(...), sequence_text:
             form={"reorder_doc_id": doc_id, "reorder_sequence_text": sequence_text},
         )
 
-    data = fp.read_bytes()
-    total = 0
-    try:
-        total = pdf_page_count(data)
-    except Exception:
+    # pages are read straight from the mapped file; counting + reordering share it
+    with _mapped_pdf(fp) as data:
         total = 0
+        try:
+            total = pdf_page_count(data)
+        except Exception:
+            total = 0
 
-    try:
-        seq = parse_page_sequence(sequence_text, total_pages=total or 10**9)
-    except Exception as e:
-        return _render_pdf_tools(
-            request,
-            status_code=400,
-            result=f"⚠️ Hibás sorrend (példa: 3,1,2,5-7). Részlet: {e}",
-            result_kind="warn",
-            form={"reorder_doc_id": doc_id, "reorder_sequence_text": sequence_text},
-        )
-
-    if not seq:
-        return _render_pdf_tools(
-            request,
-            status_code=400,
-            result="⚠️ Adj meg oldalsorrendet (példa: 3,1,2,5-7).",
-            result_kind="warn",
-            form={"reorder_doc_id": doc_id, "reorder_sequence_text": sequence_text},
-        )
+        try:
+            seq = parse_page_sequence(sequence_text, total_pages=total or 10**9)
+        except Exception as e:
+            return _render_pdf_tools(
+                request,
+                status_code=400,
+                result=f"⚠️ Hibás sorrend (példa: 3,1,2,5-7). Részlet: {e}",
+                result_kind="warn",
+                form={"reorder_doc_id": doc_id, "reorder_sequence_text": sequence_text},
+            )
+
+        if not seq:
+            return _render_pdf_tools(
+                request,
+                status_code=400,
+                result="⚠️ Adj meg oldalsorrendet (példa: 3,1,2,5-7).",
+                result_kind="warn",
+                form={"reorder_doc_id": doc_id, "reorder_sequence_text": sequence_text},
+            )
 
-    try:
-        out = reorder_pages_pdf_bytes(data, seq)
-    except Exception as e:
-        return _render_pdf_tools(
-            request,
-            status_code=400,
-            result=f"❌ Reorder nem sikerült: {e}",
-            result_kind="error",
-            form={"reorder_doc_id": doc_id, "reorder_sequence_text": sequence_text},
-        )
+        try:
+            out = reorder_pages_pdf_bytes(data, seq)
+        except Exception as e:
+            return _render_pdf_tools(
+                request,
+                status_code=400,
+                result=f"❌ Reorder nem sikerült: {e}",
+                result_kind="error",
+                form={"reorder_doc_id": doc_id, "reorder_sequence_text": sequence_text},
+            )
 
     original_out = f"reorder_{doc.get('original_name','document.pdf')}"
     title_out = f"Reorder — {doc.get('title') or doc.get('original_name','PDF')}"
-    new_id = _store_pdf_bytes_as_document(out, title=title_out, original_name=original_out, language=doc.get("language") or "auto")
+    new_id = _store_pdf_bytes_as_document(
+        out, title=title_out, original_name=original_out, language=doc.get("language") or "auto", background=True
+    )
     new_doc = get_document(new_id)
 
     return _render_pdf_tools(
@@ -1082,7 +1229,7 @@ def study_home(request: Request, msg: str = ""):
     total, due = get_study_counts()
     ctx = {
         "request": request,
-        "docs": list_documents(),
+        "docs": list_documents_meta(),
         "total": total,
         "due": due,
         "msg": (msg or "").strip(),
@@ -1122,7 +1269,7 @@ def study_generate_preview(
         notes = list_notes(limit=500, document_id=doc_selected)
         for n in notes:
             note_doc_id = doc_selected if doc_selected is not None else (n.get("document_id") or None)
-            pairs = extract_qa_pairs(n.get("body") or "")
+            pairs = _cached_qa_pairs(n.get("body") or "")
             for q, a in pairs:
                 q2 = (q or "").strip()
                 a2 = (a or "").strip()
@@ -1145,8 +1292,9 @@ def study_generate_preview(
             docs_to_use = [get_document(doc_selected)]
         else:
             # Safety limit: avoid generating a massive deck by accident
-            docs_to_use = list_documents()[:8]
+            docs_to_use = list_documents(limit=8)
 
+        with_text = []
         for d in docs_to_use:
             if not d:
                 continue
@@ -1154,9 +1302,11 @@ def study_generate_preview(
             if not body:
                 empty_docs += 1
                 continue
+            with_text.append((d, body))
 
-            pairs = extract_qa_pairs(body)[:300]
-            for q, a in pairs:
+        all_pairs = _cached_qa_pairs_many([body for _, body in with_text])
+        for (d, _body), pairs in zip(with_text, all_pairs):
+            for q, a in pairs[:300]:
                 q2 = (q or "").strip()
                 a2 = (a or "").strip()
                 if not q2 or not a2:
@@ -1171,28 +1321,27 @@ def study_generate_preview(
                     }
                 )
 
-    # Dedup within preview itself
+    # Dedup within preview itself (digest keys: hashed once, 16 bytes each). The preview is
+    # bounded, so stop at the cap: seen never grows past 350 entries however many pairs
+    # the sources produced, and the rest are never hashed.
     uniq: List[Dict[str, Any]] = []
     seen = set()
     for it in items:
-        key = (it.get("document_id"), it.get("question"), it.get("answer"))
+        key = study_card_key(it.get("document_id"), it.get("question"), it.get("answer"))
         if key in seen:
             continue
         seen.add(key)
         uniq.append(it)
-    items = uniq[:350]  # keep preview bounded
+        if len(uniq) >= _PREVIEW_MAX_ITEMS:
+            break
+    items = uniq
 
-    doc_ids = list({it.get("document_id") for it in items})
-    existing = existing_study_card_keys(doc_ids)
-    new_n = 0
-    dup_n = 0
-    for it in items:
-        key = (it.get("document_id"), it.get("question"), it.get("answer"))
-        it["is_dup"] = key in existing
-        if it["is_dup"]:
-            dup_n += 1
-        else:
-            new_n += 1
+    # classified against stored cards in SQLite (one indexed query)
+    flags = existing_study_card_flags([(it.get("document_id"), it.get("question"), it.get("answer")) for it in items])
+    dup_n = sum(flags)
+    new_n = len(items) - dup_n
+    for it, is_dup in zip(items, flags):
+        it["is_dup"] = is_dup
 
     token = _preview_cache_put(items)
 
@@ -1202,7 +1351,7 @@ def study_generate_preview(
 
     ctx = {
         "request": request,
-        "docs": list_documents(),
+        "docs": list_documents_meta(),
         "doc_selected": doc_selected,
         "include_notes": 1 if do_notes else 0,
         "include_docs": 1 if do_docs else 0,
@@ -1238,24 +1387,17 @@ def study_generate_commit(
             continue
     picked = sorted(set([i for i in picked if 0 <= i < len(items)]))
 
+    rows = []
     for i in picked:
         it = items[i]
         if it.get("is_dup"):
             skipped_dup += 1
             continue
-        cid, is_new = create_study_card(
-            it.get("question") or "",
-            it.get("answer") or "",
-            document_id=it.get("document_id"),
-            note_id=it.get("note_id"),
-            explanation="",
-        )
-        if cid is None:
-            continue
-        if is_new:
-            created += 1
-        else:
-            skipped_dup += 1
+        rows.append((it.get("question") or "", it.get("answer") or "", it.get("document_id"), it.get("note_id"), ""))
+
+    # one transaction for the whole selection; cards saved meanwhile count as duplicates
+    created, dup = create_study_cards_bulk(rows)
+    skipped_dup += dup
 
     msg = f"✅ Mentve: +{created} | duplikált: {skipped_dup} | kiválasztva: {len(picked)}"
     return RedirectResponse(url="/study?msg=" + quote_plus(msg), status_code=303)
@@ -1268,7 +1410,7 @@ def study_cards_page(request: Request, q: str = "", doc: str = ""):
     ctx = {
         "request": request,
         "q": (q or "").strip(),
-        "docs": list_documents(),
+        "docs": list_documents_meta(),
         "doc_selected": doc_selected,
         "cards": cards,
     }
@@ -1281,7 +1423,7 @@ def study_card_new(request: Request, doc: str = ""):
     doc_selected = _parse_int_or_none(doc)
     ctx = {
         "request": request,
-        "docs": list_documents(),
+        "docs": list_documents_meta(),
         "doc_selected": doc_selected,
         "card": None,
     }
@@ -1307,7 +1449,7 @@ def study_card_edit(request: Request, card_id: int):
     card = get_study_card(card_id)
     ctx = {
         "request": request,
-        "docs": list_documents(),
+        "docs": list_documents_meta(),
         "doc_selected": card.get("document_id") if card else None,
         "card": card,
         "practice": 0,
@@ -1326,7 +1468,21 @@ def study_card_edit_post(
     explanation: str = Form(""),
 ):
     doc_id = _parse_int_or_none(document_id)
-    update_study_card(card_id, question, answer, explanation, doc_id)
+    if not update_study_card(card_id, question, answer, explanation, doc_id):
+        # keep what the user typed and say why it was not saved
+        card = get_study_card(card_id)
+        if card is not None:
+            card = dict(card, question=question, answer=answer, explanation=explanation)
+        ctx = {
+            "request": request,
+            "docs": list_documents_meta(),
+            "doc_selected": doc_id,
+            "card": card,
+            "practice": 0,
+            "msg": "⚠️ Ilyen kártya már létezik ehhez a dokumentumhoz (azonos kérdés és válasz) — nem mentettem.",
+        }
+        ctx.update(_settings_context())
+        return templates.TemplateResponse("study_card_edit.html", ctx, status_code=409)
     return RedirectResponse(url="/study/cards", status_code=303)
 
 
@@ -1349,7 +1505,7 @@ def study_session(request: Request, doc: str = "", show: int = 0, card_id: int =
         card = get_study_card(int(card_id))
         ctx = {
             "request": request,
-            "docs": list_documents(),
+            "docs": list_documents_meta(),
             "doc_selected": doc_selected,
             "show": show_int,
             "card": card,
@@ -1368,7 +1524,7 @@ def study_session(request: Request, doc: str = "", show: int = 0, card_id: int =
 
     ctx = {
         "request": request,
-        "docs": list_documents(),
+        "docs": list_documents_meta(),
         "doc_selected": doc_selected,
         "show": show_int,
         "card": card,
@@ -1411,7 +1567,7 @@ def study_quiz(request: Request, doc: str = ""):
 
     ctx = {
         "request": request,
-        "docs": list_documents(),
+        "docs": list_documents_meta(),
         "doc_selected": doc_selected,
         "card": card,
         "practice": practice,
@@ -1443,7 +1599,7 @@ def study_quiz_answer(
 
     ctx = {
         "request": request,
-        "docs": list_documents(),
+        "docs": list_documents_meta(),
         "doc_selected": doc_selected,
         "card": card,
         "practice": int(practice or 0),
@@ -1463,7 +1619,7 @@ def study_stats_page(request: Request, doc: str = ""):
     by_doc = study_stats_by_document()
     ctx = {
         "request": request,
-        "docs": list_documents(),
+        "docs": list_documents_meta(),
         "doc_selected": doc_selected,
         "total": s["total"],
         "due": s["due"],
@@ -1480,19 +1636,23 @@ def study_stats_page(request: Request, doc: str = ""):
 def study_export_csv(doc: str = ""):
     import csv
     doc_selected = _parse_int_or_none(doc)
-    cards = list_study_cards(q="", document_id=doc_selected, limit=5000)
 
-    import io as _io
-    buf = _io.StringIO()
-    w = csv.writer(buf)
-    w.writerow(["card_id", "document", "box", "due_at", "question", "answer"])
-    for c in cards:
-        w.writerow([c.get('id'), c.get('document_title') or '', c.get('box') or '', c.get('due_at') or '', c.get('question') or '', c.get('answer') or ''])
-    data = buf.getvalue().encode('utf-8')
+    def gen():
+        # rows go out in ~200-row chunks as the cursor produces them
+        buf = io.StringIO()
+        w = csv.writer(buf)
+        w.writerow(["card_id", "document", "box", "due_at", "question", "answer"])
+        for i, c in enumerate(iter_study_cards_export(doc_selected, limit=5000), 1):
+            w.writerow([c['id'], c['document_title'] or '', c['box'] or '', c['due_at'] or '', c['question'] or '', c['answer'] or ''])
+            if i % 200 == 0:
+                yield buf.getvalue().encode('utf-8')
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue().encode('utf-8')
 
     fname = 'study_cards.csv'
     if doc_selected is not None:
         fname = f'study_cards_doc_{doc_selected}.csv'
-    return StreamingResponse(_io.BytesIO(data), media_type='text/csv; charset=utf-8', headers={
+    return StreamingResponse(gen(), media_type='text/csv; charset=utf-8', headers={
         'Content-Disposition': f'attachment; filename="{fname}"'
     })
@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 import io
+import mmap
 import re
 import unicodedata
 from pathlib import Path
@@ -20,6 +21,37 @@ _SEP_PATTERNS = [
     r"\s*->\s*",
     r"\s*=>\s*",
 ]
+# Compiled once: the extractor runs over whole PDF texts, line by line. Precedence is
+# list order (first pattern that matches anywhere wins), so the ordered list is kept;
+# the alternation only answers "is there any separator at all", in a single scan.
+_SEP_RES = [re.compile(p) for p in _SEP_PATTERNS]
+_ANY_SEP_RE = re.compile("|".join(f"(?:{p})" for p in _SEP_PATTERNS))
+_BULLET_RE = re.compile(r"^[\-*•\u2022\u25CF]+\s+")
+
+
+def _strip_bullet(s: str) -> str:
+    return _BULLET_RE.sub("", (s or "").strip()).strip()
+
+
+def _looks_like_new_qa(x: str) -> bool:
+    if not x:
+        return False
+    xl = x.lower()
+    if xl.startswith("q:") or xl.startswith("a:"):
+        return True
+    return _ANY_SEP_RE.search(x) is not None
+
+
+def _should_attach(ans: str, nxt: str) -> bool:
+    if not ans or not nxt:
+        return False
+    if ans.rstrip().endswith((",", ";", "-", "–", "—")):
+        return True
+    if len(ans) < 60:
+        return True
+    if not ans.rstrip().endswith((".", "!", "?")) and nxt[:1].islower():
+        return True
+    return False
 
 
 def extract_qa_pairs(note_body: str) -> List[Tuple[str, str]]:
@@ -36,9 +68,6 @@ def extract_qa_pairs(note_body: str) -> List[Tuple[str, str]]:
     text = (note_body or "").replace("\r\n", "\n").replace("\r", "\n")
     raw_lines = [ln.strip() for ln in text.split("\n")]
 
-    def _strip_bullet(s: str) -> str:
-        return re.sub(r"^[\-*•\u2022\u25CF]+\s+", "", (s or "").strip()).strip()
-
     # Normalize, keep only non-empty lines
     lines = [_strip_bullet(ln) for ln in raw_lines]
     lines = [ln for ln in lines if ln]
@@ -69,10 +98,11 @@ def extract_qa_pairs(note_body: str) -> List[Tuple[str, str]]:
             continue
 
         m = None
-        for pat in _SEP_PATTERNS:
-            m = re.search(pat, l)
-            if m:
-                break
+        if _ANY_SEP_RE.search(l):
+            for rx in _SEP_RES:
+                m = rx.search(l)
+                if m:
+                    break
         if not m:
             i += 1
             continue
@@ -80,28 +110,6 @@ def extract_qa_pairs(note_body: str) -> List[Tuple[str, str]]:
         left = l[: m.start()].strip()
         right = l[m.end() :].strip()
 
-        def _looks_like_new_qa(x: str) -> bool:
-            if not x:
-                return False
-            xl = x.lower()
-            if xl.startswith("q:") or xl.startswith("a:"):
-                return True
-            for pat2 in _SEP_PATTERNS:
-                if re.search(pat2, x):
-                    return True
-            return False
-
-        def _should_attach(ans: str, nxt: str) -> bool:
-            if not ans or not nxt:
-                return False
-            if ans.rstrip().endswith((",", ";", "-", "–", "—")):
-                return True
-            if len(ans) < 60:
-                return True
-            if not ans.rstrip().endswith((".", "!", "?")) and nxt[:1].islower():
-                return True
-            return False
-
         j = i + 1
         while j < len(lines):
             nxt = lines[j]
@@ -178,8 +186,16 @@ def make_snippet(text: str, q: str, radius: int = 80) -> str:
     return prefix + t[start:end].replace("\n", " ").strip() + suffix
 
 
+def _pdf_stream(pdf_bytes):
+    """Seekable stream for PdfReader. An mmap already is one (BytesIO(mm) would copy it)."""
+    if isinstance(pdf_bytes, mmap.mmap):
+        pdf_bytes.seek(0)
+        return pdf_bytes
+    return io.BytesIO(pdf_bytes)
+
+
 def pdf_page_count(pdf_bytes: bytes) -> int:
-    reader = PdfReader(io.BytesIO(pdf_bytes))
+    reader = PdfReader(_pdf_stream(pdf_bytes))
     return len(reader.pages)
 
 
@@ -247,6 +263,31 @@ def split_pdf_bytes(pdf_bytes: bytes,
     return outputs
 
 
+# one page token: "7" or "3-5" (whitespace allowed around numbers and dash);
+# tokens are separated by "," or ";"
+_PAGE_TOKEN_RE = re.compile(r"\s*(\d+)\s*(?:-\s*(\d+)\s*)?")
+_PAGE_SEP_RE = re.compile(r"[,;]")
+
+
+def _page_tokens(text: str) -> List[Tuple[int, int]]:
+    """(a, b) per token with 1 <= a <= b; ValueError on anything else."""
+    out: List[Tuple[int, int]] = []
+    for p in _PAGE_SEP_RE.split(text or ""):
+        if not p.strip():
+            continue
+        m = _PAGE_TOKEN_RE.fullmatch(p)
+        if m is None:
+            raise ValueError(f"Invalid range token: {p.strip()!r}")
+        a = int(m[1])
+        b = int(m[2]) if m[2] else a
+        if a <= 0 or b <= 0:
+            raise ValueError("Page numbers must be >= 1")
+        if a > b:
+            a, b = b, a
+        out.append((a, b))
+    return out
+
+
 def parse_ranges(ranges_text: str) -> List[Tuple[int, int]]:
     """
     Parses 1-based inclusive page ranges.
@@ -255,35 +296,7 @@ def parse_ranges(ranges_text: str) -> List[Tuple[int, int]]:
       "1-3, 5, 7-10" -> [(1,3),(5,5),(7,10)]
       " 2 ; 4-6 "    -> [(2,2),(4,6)]
     """
-    s = (ranges_text or "").strip()
-    if not s:
-        return []
-
-    # allow ";" as separator too
-    s = s.replace(";", ",")
-    parts = [p.strip() for p in s.split(",") if p.strip()]
-
-    out: List[Tuple[int, int]] = []
-    for p in parts:
-        if "-" in p:
-            x, y = p.split("-", 1)
-            x = x.strip()
-            y = y.strip()
-            if not x or not y:
-                raise ValueError(f"Invalid range token: {p!r}")
-            a = int(x)
-            b = int(y)
-            if a <= 0 or b <= 0:
-                raise ValueError("Page numbers must be >= 1")
-            if a > b:
-                a, b = b, a
-            out.append((a, b))
-        else:
-            n = int(p)
-            if n <= 0:
-                raise ValueError("Page numbers must be >= 1")
-            out.append((n, n))
-    return out
+    return _page_tokens(ranges_text)
 
 
 def merge_pdf_bytes(pdf_list: List[bytes]) -> bytes:
@@ -371,37 +384,12 @@ def parse_page_sequence(sequence_text: str, total_pages: int) -> List[int]:
 
     Raises ValueError on invalid tokens or out-of-range pages.
     """
-    s = (sequence_text or "").strip()
-    if not s:
-        return []
-
-    s = s.replace(";", ",")
-    parts = [p.strip() for p in s.split(",") if p.strip()]
-
     seq: List[int] = []
-    for p in parts:
-        if "-" in p:
-            x, y = p.split("-", 1)
-            x = x.strip()
-            y = y.strip()
-            if not x or not y:
-                raise ValueError(f"Invalid range token: {p!r}")
-            a = int(x)
-            b = int(y)
-            if a <= 0 or b <= 0:
-                raise ValueError("Page numbers must be >= 1")
-            if a > b:
-                a, b = b, a
-            for n in range(a, b + 1):
-                if n < 1 or n > total_pages:
-                    raise ValueError(f"Page {n} out of range (1..{total_pages})")
-                seq.append(n)
-        else:
-            n = int(p)
-            if n < 1 or n > total_pages:
-                raise ValueError(f"Page {n} out of range (1..{total_pages})")
-            seq.append(n)
-
+    for a, b in _page_tokens(sequence_text):
+        if b > total_pages:
+            # first page of the token past the end
+            raise ValueError(f"Page {max(a, total_pages + 1)} out of range (1..{total_pages})")
+        seq.extend(range(a, b + 1))
     return seq
 
 
@@ -409,7 +397,7 @@ def extract_pages_pdf_bytes(pdf_bytes: bytes, ranges: List[Tuple[int, int]]) ->
     """
     Extract pages given by inclusive ranges, keeping natural order.
     """
-    reader = PdfReader(io.BytesIO(pdf_bytes))
+    reader = PdfReader(_pdf_stream(pdf_bytes))
     total = len(reader.pages)
     seq: List[int] = []
     for a, b in ranges:
@@ -442,7 +430,7 @@ def reorder_pages_pdf_bytes(pdf_bytes: bytes, sequence: List[int]) -> bytes:
     Reorder / duplicate pages based on sequence (1-based).
     Example: [3,1,1,2] duplicates page 1.
     """
-    reader = PdfReader(io.BytesIO(pdf_bytes))
+    reader = PdfReader(_pdf_stream(pdf_bytes))
     total = len(reader.pages)
     if not sequence:
         raise ValueError("No page sequence provided")
@@ -1,30 +1,88 @@
 # db.py
 from __future__ import annotations
 
+import json
+import queue
+import random
 import sqlite3
-from typing import Any, Dict, List, Optional, Tuple
+import threading
+from collections.abc import Mapping
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 DB_PATH = "app.db"
 
+# journal_mode=WAL is persistent in the db file, so it only needs to be set once per process
+_wal_set = False
+
 
 def get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    global _wal_set
+    # isolation_level=None: autocommit, so pure reads never open an implicit transaction;
+    # writers go through _checkout(write=True), which issues BEGIN IMMEDIATE. The bigger statement cache keeps
+    # every helper's SQL prepared for the lifetime of a pooled connection.
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256, isolation_level=None)
     conn.row_factory = sqlite3.Row
     # Enable FK constraints (sqlite defaults to OFF)
     try:
         conn.execute("PRAGMA foreign_keys = ON")
     except Exception:
         pass
+
+    # WAL: readers don't block the writer; NORMAL sync = fsync on checkpoint, not every commit
+    if not _wal_set and DB_PATH != ":memory:":
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            _wal_set = True
+        except Exception:
+            pass
+    try:
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -64000")
+        conn.execute("PRAGMA mmap_size = 268435456")
+        conn.execute("PRAGMA busy_timeout = 5000")
+    except Exception:
+        pass
     return conn
 
 
-def init_db() -> None:
-    """Initialize tables and insert default settings keys if missing."""
-    conn = get_conn()
-    cur = conn.cursor()
+# Small LIFO pool of long-lived connections: keeps the page cache warm and skips
+# connect + PRAGMA setup on every helper call. A connection is only ever used by
+# the thread that checked it out, so check_same_thread=False is safe here.
+_POOL_SIZE = 8
+_POOL: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=_POOL_SIZE)
 
-    cur.execute(
-        """
+
+@contextmanager
+def _checkout(write: bool = False) -> Iterator[sqlite3.Connection]:
+    """Borrow a pooled connection (opens a new one if the pool is empty).
+
+    write=True starts a BEGIN IMMEDIATE transaction: the write lock is taken up
+    front (waiting up to busy_timeout) instead of on the first write, where a
+    deferred transaction can fail with "database is locked". The caller commits.
+    """
+    try:
+        conn = _POOL.get_nowait()
+    except queue.Empty:
+        conn = get_conn()
+    try:
+        if write:
+            conn.execute("BEGIN IMMEDIATE")
+        yield conn
+    finally:
+        # never hand back a connection with an open transaction
+        try:
+            conn.rollback()
+            _POOL.put_nowait(conn)
+        except Exception:
+            conn.close()
+
+
+# Tables and plain indexes. The conditional pieces (unique card index, review ring
+# buffer, FTS) are set up in init_db after this script.
+_SCHEMA = """
     CREATE TABLE IF NOT EXISTS documents (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
       title TEXT NOT NULL,
@@ -35,12 +93,8 @@ def init_db() -> None:
       doc_type TEXT DEFAULT 'pdf',
       search_text TEXT DEFAULT '',
       created_at TEXT DEFAULT (datetime('now'))
-    )
-    """
-    )
+    );
 
-    cur.execute(
-        """
     CREATE TABLE IF NOT EXISTS notes (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
       title TEXT NOT NULL,
@@ -48,23 +102,15 @@ def init_db() -> None:
       document_id INTEGER NULL,
       created_at TEXT DEFAULT (datetime('now')),
       FOREIGN KEY(document_id) REFERENCES documents(id)
-    )
-    """
-    )
+    );
 
-    # Key-value settings table
-    cur.execute(
-        """
+    -- Key-value settings table
     CREATE TABLE IF NOT EXISTS settings (
       key TEXT PRIMARY KEY,
       value TEXT NOT NULL
-    )
-    """
-    )
+    );
 
-    # ---------------- Study (cards + simple SRS + reviews) ----------------
-    cur.execute(
-        """
+    -- ---------------- Study (cards + simple SRS + reviews) ----------------
     CREATE TABLE IF NOT EXISTS study_cards (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
       document_id INTEGER NULL,
@@ -74,12 +120,8 @@ def init_db() -> None:
       created_at TEXT DEFAULT (datetime('now')),
       FOREIGN KEY(document_id) REFERENCES documents(id) ON DELETE SET NULL,
       FOREIGN KEY(note_id) REFERENCES notes(id) ON DELETE SET NULL
-    )
-    """
-    )
+    );
 
-    cur.execute(
-        """
     CREATE TABLE IF NOT EXISTS study_srs (
       card_id INTEGER PRIMARY KEY,
       box INTEGER NOT NULL DEFAULT 1,
@@ -87,12 +129,8 @@ def init_db() -> None:
       last_review_at TEXT NULL,
       correct_streak INTEGER NOT NULL DEFAULT 0,
       FOREIGN KEY(card_id) REFERENCES study_cards(id) ON DELETE CASCADE
-    )
-    """
-    )
+    );
 
-    cur.execute(
-        """
     CREATE TABLE IF NOT EXISTS study_reviews (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
       card_id INTEGER NOT NULL,
@@ -100,58 +138,245 @@ def init_db() -> None:
       source TEXT NOT NULL DEFAULT 'session',
       created_at TEXT DEFAULT (datetime('now')),
       FOREIGN KEY(card_id) REFERENCES study_cards(id) ON DELETE CASCADE
-    )
-    """
-    )
+    );
+
+    -- (document_id, id) covers the per-document id sort; supersedes the old document_id-only index
+    DROP INDEX IF EXISTS idx_study_cards_doc;
+    CREATE INDEX IF NOT EXISTS idx_study_cards_doc_id ON study_cards(document_id, id);
+    -- (due_at, box, card_id) also serves plain due_at lookups; supersedes the old due_at-only index
+    DROP INDEX IF EXISTS idx_study_srs_due;
+    CREATE INDEX IF NOT EXISTS idx_study_srs_due_box ON study_srs(due_at, box, card_id);
+    CREATE INDEX IF NOT EXISTS idx_study_reviews_card ON study_reviews(card_id);
+"""
+
+
+_DEFAULT_SETTINGS = [
+    ("ui_lang", "hu"),
+    ("answer_language", "hu"),
+    ("theme", "dark"),
+    ("manual_mode", "0"),
+    ("translation_style", "precise"),
+    ("default_gpt_mode", "exam"),
+]
+
+
+def init_db() -> None:
+    """Initialize tables and insert default settings keys if missing."""
+    conn = get_conn()
+    cur = conn.cursor()
+    # static DDL: one script, one transaction
+    conn.executescript("BEGIN;\n" + _SCHEMA + "COMMIT;")
+
+    cur.execute("BEGIN IMMEDIATE")
 
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_study_cards_doc ON study_cards(document_id)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_study_srs_due ON study_srs(due_at)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_study_reviews_card ON study_reviews(card_id)")
+    # one card per (document, question, answer); NULL documents compare equal via -1
+    global _cards_unique
+    try:
+        cur.execute("SAVEPOINT cards_uniq")
+        cur.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_study_cards_uniq "
+            "ON study_cards(COALESCE(document_id, -1), question, answer)"
+        )
+        cur.execute("RELEASE cards_uniq")
+        _cards_unique = True
+    except sqlite3.IntegrityError:
+        # legacy duplicates: keep working with the select-then-insert dedup
+        cur.execute("ROLLBACK TO cards_uniq")
+        cur.execute("RELEASE cards_uniq")
+        _cards_unique = False
+
+    _init_recent_reviews(cur)
 
-    # Defaults
-    _set_default(cur, "ui_lang", "hu")
-    _set_default(cur, "answer_language", "hu")
-    _set_default(cur, "theme", "dark")
-    _set_default(cur, "manual_mode", "0")
-    _set_default(cur, "translation_style", "precise")
-    _set_default(cur, "default_gpt_mode", "exam")
+    global _fts_enabled
+    _fts_enabled = _init_fts(cur)
+
+    # Defaults (existing keys are left alone)
+    cur.executemany("INSERT OR IGNORE INTO settings(key, value) VALUES(?, ?)", _DEFAULT_SETTINGS)
 
     conn.commit()
     conn.close()
 
+    # drop any settings read before the defaults existed
+    _invalidate_settings()
+
+
+# ---------- rows ----------
+# Explicit projections instead of SELECT *. documents.search_text (the extracted
+# PDF text, often many KB) is only read when a caller asks for it.
+_CARD_COLS = "c.id, c.document_id, c.note_id, c.question, c.answer, c.created_at"
+_NOTE_COLS = ("id", "title", "body", "document_id", "created_at")
+_DOC_COLS = ("id", "title", "original_name", "stored_name", "language", "pages", "doc_type", "created_at")
+
+
+def _cols(names: Tuple[str, ...], alias: str = "") -> str:
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(prefix + n for n in names)
+
+
+def _doc_cols(include_text: bool, alias: str = "") -> str:
+    return _cols(_DOC_COLS + (("search_text",) if include_text else ()), alias)
+
+
+class _RowView(Mapping):
+    """Mapping over a sqlite3.Row without copying it into a dict.
+
+    Supports row["col"], .get(), `in` and iteration like the dicts callers used to
+    get. Keys assigned afterwards (e.g. ask snippets) live in a small overlay dict
+    that is only created on first write.
+    """
+
+    __slots__ = ("_r", "_extra")
+    _ALIASES: Dict[str, str] = {}
+
+    def __init__(self, row: sqlite3.Row) -> None:
+        self._r = row
+        self._extra: Optional[Dict[str, Any]] = None
+
+    def __getitem__(self, key: str) -> Any:
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        try:
+            return self._r[self._ALIASES.get(key, key)]
+        except IndexError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __iter__(self) -> Iterator[str]:
+        cols = self._r.keys()
+        yield from cols
+        yield from (a for a, col in self._ALIASES.items() if col in cols)
+        if self._extra is not None:
+            yield from (k for k in self._extra if k not in cols and k not in self._ALIASES)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+class _DocRowView(_RowView):
+    """Document row; also answers the legacy template keys type/page_count."""
+
+    __slots__ = ()
+    _ALIASES = {"type": "doc_type", "page_count": "pages"}
+
+
+# ---------- full-text search ----------
+# External-content FTS5 indexes kept in sync by triggers. The trigram tokenizer
+# matches arbitrary substrings (case-insensitive), so MATCH keeps the semantics
+# of the old LIKE '%q%' scans while being served from an index.
+_FTS_TABLES = (
+    ("documents_fts", "documents", ("title", "original_name", "search_text")),
+    ("notes_fts", "notes", ("title", "body")),
+    ("cards_fts", "study_cards", ("question", "answer")),
+)
+_fts_enabled = False
+
+
+def _init_fts(cur: sqlite3.Cursor) -> bool:
+    """Create FTS tables + sync triggers; False if this sqlite build lacks fts5/trigram."""
+    try:
+        for name, table, cols in _FTS_TABLES:
+            cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,))
+            fresh = cur.fetchone() is None
+
+            col_sql = ", ".join(cols)
+            new_sql = ", ".join(f"new.{c}" for c in cols)
+            old_sql = ", ".join(f"old.{c}" for c in cols)
+            cur.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5("
+                f"{col_sql}, content='{table}', content_rowid='id', tokenize='trigram')"
+            )
+            cur.execute(
+                f"""
+            CREATE TRIGGER IF NOT EXISTS {name}_ai AFTER INSERT ON {table} BEGIN
+              INSERT INTO {name}(rowid, {col_sql}) VALUES (new.id, {new_sql});
+            END
+            """
+            )
+            cur.execute(
+                f"""
+            CREATE TRIGGER IF NOT EXISTS {name}_ad AFTER DELETE ON {table} BEGIN
+              INSERT INTO {name}({name}, rowid, {col_sql}) VALUES ('delete', old.id, {old_sql});
+            END
+            """
+            )
+            cur.execute(
+                f"""
+            CREATE TRIGGER IF NOT EXISTS {name}_au AFTER UPDATE OF {col_sql} ON {table} BEGIN
+              INSERT INTO {name}({name}, rowid, {col_sql}) VALUES ('delete', old.id, {old_sql});
+              INSERT INTO {name}(rowid, {col_sql}) VALUES (new.id, {new_sql});
+            END
+            """
+            )
+            if fresh:
+                # backfill rows that existed before the index did
+                cur.execute(f"INSERT INTO {name}({name}) VALUES ('rebuild')")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def _fts_phrase(q: str) -> Optional[str]:
+    """q quoted as an FTS5 phrase, or None when the search has to fall back to LIKE.
+
+    Trigram indexes can't answer queries shorter than 3 characters.
+    """
+    q = (q or "").strip()
+    if not _fts_enabled or len(q) < 3:
+        return None
+    return '"' + q.replace('"', '""') + '"'
+
 
 # ---------- study cards ----------
+def _today() -> str:
+    """Today's date as stored in study_srs.due_at (UTC, like sqlite's date('now')).
+
+    Comparing the raw column against a bound value keeps the due_at index usable;
+    wrapping the column in date() forces a full scan.
+    """
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def _now() -> str:
+    """Current UTC timestamp in sqlite's datetime('now') format."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
 _LEITNER_INTERVALS_DAYS = {1: 0, 2: 1, 3: 3, 4: 7, 5: 14}
 
+# Leitner step evaluated inside the srs UPSERT (column refs = the row before the update)
+_NEW_BOX_SQL = "CASE WHEN :correct THEN MIN(box + 1, 5) ELSE 1 END"
+_NEW_INTERVAL_SQL = (
+    f"CASE {_NEW_BOX_SQL} "
+    + " ".join(f"WHEN {b} THEN {d}" for b, d in _LEITNER_INTERVALS_DAYS.items())
+    + " ELSE 0 END"
+)
+
 
 def _same_nullable(a: Any, b: Any) -> bool:
     return (a is None and b is None) or (a == b)
 
 
-def _find_existing_card_id(document_id: Optional[int], question: str, answer: str) -> Optional[int]:
-    """Dedup helper (keeps null-doc distinct)."""
-    conn = get_conn()
-    cur = conn.cursor()
-    if document_id is None:
-        cur.execute(
-            """
-        SELECT id FROM study_cards
-        WHERE document_id IS NULL AND question=? AND answer=?
-        LIMIT 1
-        """,
-            (question, answer),
-        )
-    else:
-        cur.execute(
-            """
-        SELECT id FROM study_cards
-        WHERE document_id=? AND question=? AND answer=?
-        LIMIT 1
-        """,
-            (int(document_id), question, answer),
-        )
+_cards_unique = False
+
+
+def _find_existing_card_id(cur: sqlite3.Cursor, document_id: Optional[int], question: str, answer: str) -> Optional[int]:
+    """Dedup helper (keeps null-doc distinct); probes idx_study_cards_uniq."""
+    cur.execute(
+        """
+    SELECT id FROM study_cards
+    WHERE COALESCE(document_id, -1)=COALESCE(?, -1) AND question=? AND answer=?
+    LIMIT 1
+    """,
+        (document_id, question, answer),
+    )
     row = cur.fetchone()
-    conn.close()
     return int(row["id"]) if row else None
 
 
@@ -167,196 +392,320 @@ def create_study_card(
     if not q or not a:
         return None, False
 
-    existing = _find_existing_card_id(document_id, q, a)
-    if existing is not None:
-        return existing, False
-
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-    INSERT INTO study_cards(document_id, note_id, question, answer)
-    VALUES(?,?,?,?)
-    """,
-        (document_id, note_id, q, a),
-    )
-    card_id = int(cur.lastrowid)
-    cur.execute(
-        """
-    INSERT OR REPLACE INTO study_srs(card_id, box, due_at, last_review_at, correct_streak)
-    VALUES(?, 1, date('now'), NULL, 0)
-    """,
-        (card_id,),
-    )
-    conn.commit()
-    conn.close()
+    with _checkout(write=True) as conn:
+        cur = conn.cursor()
+        if _cards_unique:
+            # the unique index does the dedup: a conflict returns no row
+            cur.execute(
+                """
+            INSERT INTO study_cards(document_id, note_id, question, answer)
+            VALUES(?,?,?,?)
+            ON CONFLICT DO NOTHING
+            RETURNING id
+            """,
+                (document_id, note_id, q, a),
+            )
+            row = cur.fetchone()
+            if row is None:
+                conn.commit()
+                return _find_existing_card_id(cur, document_id, q, a), False
+            card_id = int(row["id"])
+        else:
+            existing = _find_existing_card_id(cur, document_id, q, a)
+            if existing is not None:
+                conn.commit()
+                return existing, False
+            cur.execute(
+                """
+            INSERT INTO study_cards(document_id, note_id, question, answer)
+            VALUES(?,?,?,?)
+            """,
+                (document_id, note_id, q, a),
+            )
+            card_id = int(cur.lastrowid)
+        cur.execute(
+            """
+        INSERT OR REPLACE INTO study_srs(card_id, box, due_at, last_review_at, correct_streak)
+        VALUES(?, 1, ?, NULL, 0)
+        """,
+            (card_id, _today()),
+        )
+        conn.commit()
     return card_id, True
 
 
-def update_study_card(card_id: int, question: str, answer: str, document_id: Optional[int]) -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
+def create_study_cards_bulk(
+    rows: List[Tuple[str, str, Optional[int], Optional[int]]],
+) -> List[Tuple[Optional[int], bool]]:
+    """Batch create_study_card: rows are (question, answer, document_id, note_id).
+
+    Returns (card_id, created_new) per input row, in order. Dedup, inserts and
+    srs rows all happen in one transaction; repeats inside the batch map to the
+    first occurrence.
+    """
+    clean = [((q or "").strip(), (a or "").strip(), doc_id, note_id) for q, a, doc_id, note_id in rows]
+    out: List[Tuple[Optional[int], bool]] = [(None, False)] * len(clean)
+
+    today = _today()
+    with _checkout(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+        CREATE TEMP TABLE IF NOT EXISTS bulk_cards (
+          idx INTEGER PRIMARY KEY,
+          document_id INTEGER NULL,
+          question TEXT NOT NULL,
+          answer TEXT NOT NULL
+        )
         """
-    UPDATE study_cards SET question=?, answer=?, document_id=? WHERE id=?
-    """,
-        ((question or "").strip(), (answer or "").strip(), document_id, int(card_id)),
-    )
-    conn.commit()
-    conn.close()
+        )
+        cur.execute("DELETE FROM bulk_cards")
+        cur.executemany(
+            "INSERT INTO bulk_cards(idx, document_id, question, answer) VALUES(?,?,?,?)",
+            [(i, doc_id, q, a) for i, (q, a, doc_id, _) in enumerate(clean) if q and a],
+        )
 
+        # one join answers "does this card exist already?" for the whole batch
+        match_sql = """
+        SELECT b.idx AS idx, MIN(c.id) AS id
+        FROM bulk_cards b
+        JOIN study_cards c
+          ON COALESCE(c.document_id, -1)=COALESCE(b.document_id, -1)
+         AND c.question=b.question AND c.answer=b.answer
+        GROUP BY b.idx
+        """
+        cur.execute(match_sql)
+        existing = {int(r["idx"]) for r in cur.fetchall()}
+
+        new_idx: List[int] = []
+        seen = set()
+        for i, (q, a, doc_id, _) in enumerate(clean):
+            key = (doc_id, q, a)
+            if not q or not a or i in existing or key in seen:
+                continue
+            seen.add(key)
+            new_idx.append(i)
+
+        cur.executemany(
+            "INSERT INTO study_cards(document_id, note_id, question, answer) VALUES(?,?,?,?)",
+            [(clean[i][2], clean[i][3], clean[i][0], clean[i][1]) for i in new_idx],
+        )
 
-def delete_study_card(card_id: int) -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM study_cards WHERE id=?", (int(card_id),))
-    conn.commit()
-    conn.close()
+        cur.execute(match_sql)
+        ids = {int(r["idx"]): int(r["id"]) for r in cur.fetchall()}
+        created = set(new_idx)
+        cur.executemany(
+            """
+        INSERT OR REPLACE INTO study_srs(card_id, box, due_at, last_review_at, correct_streak)
+        VALUES(?, 1, ?, NULL, 0)
+        """,
+            [(ids[i], today) for i in new_idx],
+        )
+        cur.execute("DELETE FROM bulk_cards")
+        conn.commit()
+
+    for i, cid in ids.items():
+        out[i] = (cid, i in created)
+    return out
+
+
+def update_study_card(card_id: int, question: str, answer: str, document_id: Optional[int]) -> bool:
+    """Returns False (nothing changed) if the edit would duplicate another card of the
+    same document (idx_study_cards_uniq)."""
+    with _checkout(write=True) as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+            UPDATE study_cards SET question=?, answer=?, document_id=? WHERE id=?
+            """,
+                ((question or "").strip(), (answer or "").strip(), document_id, int(card_id)),
+            )
+        except sqlite3.IntegrityError:
+            return False
+        conn.commit()
+    return True
 
 
-def get_study_card(card_id: int) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-    SELECT c.*, d.title AS document_title, s.box, s.due_at
-    FROM study_cards c
-    LEFT JOIN documents d ON d.id=c.document_id
-    LEFT JOIN study_srs s ON s.card_id=c.id
-    WHERE c.id=?
-    """,
-        (int(card_id),),
-    )
-    row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+def delete_study_card(card_id: int) -> None:
+    with _checkout(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM study_cards WHERE id=?", (int(card_id),))
+        # the card's reviews cascade out of the ring; refill it from older history
+        cur.execute("SELECT COUNT(*) FROM study_recent_reviews")
+        if cur.fetchone()[0] < _RECENT_REVIEWS:
+            _seed_recent_reviews(cur)
+        conn.commit()
+
+
+def get_study_card(card_id: int) -> Optional[_RowView]:
+    with _checkout() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"""
+        SELECT {_CARD_COLS}, d.title AS document_title, s.box, s.due_at
+        FROM study_cards c
+        LEFT JOIN documents d ON d.id=c.document_id
+        LEFT JOIN study_srs s ON s.card_id=c.id
+        WHERE c.id=?
+        """,
+            (int(card_id),),
+        )
+        row = cur.fetchone()
+    return _RowView(row) if row else None
 
 
 def list_study_cards(
     q: str = "",
     document_id: Optional[int] = None,
     limit: int = 200,
-) -> List[Dict[str, Any]]:
-    q2 = f"%{(q or '').strip()}%"
-    conn = get_conn()
-    cur = conn.cursor()
+) -> List[_RowView]:
+    q = (q or "").strip()
+    phrase = _fts_phrase(q)
+    with _checkout() as conn:
+        cur = conn.cursor()
+
+        where = []
+        args: List[Any] = []
+        if phrase is not None:
+            where.append("c.id IN (SELECT rowid FROM cards_fts WHERE cards_fts MATCH ?)")
+            args.append(phrase)
+        elif q:
+            where.append("(c.question LIKE '%' || ? || '%' OR c.answer LIKE '%' || ? || '%')")
+            args.extend([q, q])
+        if document_id is not None:
+            where.append("c.document_id=?")
+            args.append(int(document_id))
+        where_sql = ("WHERE " + " AND ".join(where)) if where else ""
 
-    where = []
-    args: List[Any] = []
-    if (q or "").strip():
-        where.append("(c.question LIKE ? OR c.answer LIKE ?)")
-        args.extend([q2, q2])
-    if document_id is not None:
-        where.append("c.document_id=?")
-        args.append(int(document_id))
-    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+        cur.execute(
+            f"""
+        SELECT {_CARD_COLS}, d.title AS document_title, s.box, s.due_at
+        FROM study_cards c
+        LEFT JOIN documents d ON d.id=c.document_id
+        LEFT JOIN study_srs s ON s.card_id=c.id
+        {where_sql}
+        ORDER BY s.due_at ASC, s.box ASC, c.id DESC
+        LIMIT ?
+        """,
+            (*args, int(limit)),
+        )
+        rows = cur.fetchall()
+    return [_RowView(r) for r in rows]
 
-    cur.execute(
-        f"""
-    SELECT c.*, d.title AS document_title, s.box, s.due_at
-    FROM study_cards c
-    LEFT JOIN documents d ON d.id=c.document_id
-    LEFT JOIN study_srs s ON s.card_id=c.id
-    {where_sql}
-    ORDER BY date(s.due_at) ASC, s.box ASC, c.id DESC
-    LIMIT ?
-    """,
-        (*args, int(limit)),
-    )
-    rows = cur.fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+
+def _doc_filter(document_id: Optional[int]) -> str:
+    """WHERE-clause suffix restricting alias c to one document (empty for all of them).
+
+    A literal filter lets SQLite pick the document_id index; ":doc IS NULL OR ..."
+    cannot use it and scans every card.
+    """
+    return "" if document_id is None else " AND c.document_id=:doc"
 
 
 def get_study_counts(document_id: Optional[int] = None) -> Tuple[int, int]:
-    conn = get_conn()
-    cur = conn.cursor()
-    if document_id is None:
-        cur.execute("SELECT COUNT(*) AS n FROM study_cards")
-        total = int(cur.fetchone()["n"])
-        cur.execute("SELECT COUNT(*) AS n FROM study_srs WHERE date(due_at) <= date('now')")
-        due = int(cur.fetchone()["n"])
-    else:
-        cur.execute("SELECT COUNT(*) AS n FROM study_cards WHERE document_id=?", (int(document_id),))
-        total = int(cur.fetchone()["n"])
+    doc_sql = _doc_filter(document_id)
+    with _checkout() as conn:
+        cur = conn.cursor()
+        # both counts in one row, read by position
         cur.execute(
-            """
-        SELECT COUNT(*) AS n
-        FROM study_srs s
-        JOIN study_cards c ON c.id=s.card_id
-        WHERE c.document_id=? AND date(s.due_at) <= date('now')
+            f"""
+        SELECT (SELECT COUNT(*) FROM study_cards c WHERE 1{doc_sql}),
+               (SELECT COUNT(*)
+                FROM study_srs s
+                JOIN study_cards c ON c.id=s.card_id
+                WHERE s.due_at <= :today{doc_sql})
         """,
-            (int(document_id),),
+            {"doc": None if document_id is None else int(document_id), "today": _today()},
         )
-        due = int(cur.fetchone()["n"])
-    conn.close()
-    return total, due
+        total, due = cur.fetchone()
+    return int(total), int(due)
 
 
-def get_next_due_card(document_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.cursor()
-    if document_id is None:
-        cur.execute(
-            """
-        SELECT c.*, d.title AS document_title, s.box, s.due_at
-        FROM study_srs s
-        JOIN study_cards c ON c.id=s.card_id
-        LEFT JOIN documents d ON d.id=c.document_id
-        WHERE date(s.due_at) <= date('now')
-        ORDER BY date(s.due_at) ASC, s.box ASC, c.id ASC
-        LIMIT 1
-        """
-        )
-    else:
+def get_next_due_card(document_id: Optional[int] = None) -> Optional[_RowView]:
+    with _checkout() as conn:
+        cur = conn.cursor()
         cur.execute(
-            """
-        SELECT c.*, d.title AS document_title, s.box, s.due_at
+            f"""
+        SELECT {_CARD_COLS}, d.title AS document_title, s.box, s.due_at
         FROM study_srs s
         JOIN study_cards c ON c.id=s.card_id
         LEFT JOIN documents d ON d.id=c.document_id
-        WHERE c.document_id=? AND date(s.due_at) <= date('now')
-        ORDER BY date(s.due_at) ASC, s.box ASC, c.id ASC
+        WHERE s.due_at <= :today{_doc_filter(document_id)}
+        ORDER BY s.due_at ASC, s.box ASC, c.id ASC
         LIMIT 1
         """,
-            (int(document_id),),
+            {"doc": None if document_id is None else int(document_id), "today": _today()},
         )
-    row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+        row = cur.fetchone()
+    return _RowView(row) if row else None
+
 
+def _random_pivot(cur: sqlite3.Cursor, where_sql: str, args: Tuple[Any, ...]) -> Optional[int]:
+    """Random id between MIN(id) and MAX(id) of the matching cards (None if no match).
 
-def get_random_card(document_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    Seeking from a random id is an index range scan, unlike ORDER BY RANDOM()
+    which scores and sorts the whole table. Callers pass a plain document filter
+    (not ":doc IS NULL OR ..."), which MIN/MAX needs to stay an index seek.
+    """
+    cur.execute(f"SELECT MIN(id), MAX(id) FROM study_cards c {where_sql}", args)
+    lo, hi = cur.fetchone()
+    if hi is None:
+        return None
+    return random.randint(int(lo), int(hi))
+
+
+def get_random_card(document_id: Optional[int] = None) -> Optional[_RowView]:
     """Returns a random card (useful for practice mode when nothing is due)."""
-    conn = get_conn()
-    cur = conn.cursor()
     if document_id is None:
+        where_sql, args = "", ()
+    else:
+        where_sql, args = "WHERE c.document_id=?", (int(document_id),)
+
+    with _checkout() as conn:
+        cur = conn.cursor()
+        pivot = _random_pivot(cur, where_sql, args)
+        if pivot is None:
+            return None
         cur.execute(
-            """
-        SELECT c.*, d.title AS document_title, s.box, s.due_at
+            f"""
+        SELECT {_CARD_COLS}, d.title AS document_title, s.box, s.due_at
         FROM study_cards c
         LEFT JOIN documents d ON d.id=c.document_id
         LEFT JOIN study_srs s ON s.card_id=c.id
-        ORDER BY RANDOM()
+        {where_sql + " AND" if where_sql else "WHERE"} c.id >= ?
+        ORDER BY c.id
         LIMIT 1
-        """
+        """,
+            (*args, pivot),
         )
-    else:
+        row = cur.fetchone()
+    return _RowView(row) if row else None
+
+
+def _random_answers(cur: sqlite3.Cursor, exclude_card_id: int, document_id: Optional[int], n: int) -> List[str]:
+    """Up to n answers read from a random id window (wraps around to the lowest ids)."""
+    where_sql = "WHERE c.id != ?"
+    args: Tuple[Any, ...] = (int(exclude_card_id),)
+    if document_id is not None:
+        where_sql += " AND c.document_id=?"
+        args += (int(document_id),)
+
+    pivot = _random_pivot(cur, where_sql, args)
+    if pivot is None:
+        return []
+    cur.execute(
+        f"SELECT answer FROM study_cards c {where_sql} AND c.id >= ? ORDER BY c.id LIMIT ?",
+        (*args, pivot, int(n)),
+    )
+    out = [r["answer"] for r in cur.fetchall()]
+    if len(out) < n:
         cur.execute(
-            """
-        SELECT c.*, d.title AS document_title, s.box, s.due_at
-        FROM study_cards c
-        LEFT JOIN documents d ON d.id=c.document_id
-        LEFT JOIN study_srs s ON s.card_id=c.id
-        WHERE c.document_id=?
-        ORDER BY RANDOM()
-        LIMIT 1
-        """
-            , (int(document_id),)
+            f"SELECT answer FROM study_cards c {where_sql} AND c.id < ? ORDER BY c.id LIMIT ?",
+            (*args, pivot, int(n - len(out))),
         )
-    row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+        out.extend([r["answer"] for r in cur.fetchall()])
+    return out
 
 
 def get_random_distractors(
@@ -365,35 +714,20 @@ def get_random_distractors(
     document_id: Optional[int] = None,
     k: int = 3,
 ) -> List[str]:
-    conn = get_conn()
-    cur = conn.cursor()
-    out: List[str] = []
+    # over-fetch a 2k window and sample from it, so neighbouring ids aren't always picked together
+    with _checkout() as conn:
+        cur = conn.cursor()
+        out: List[str] = []
 
-    if document_id is not None:
-        cur.execute(
-            """
-        SELECT answer FROM study_cards
-        WHERE id != ? AND document_id=?
-        ORDER BY RANDOM()
-        LIMIT ?
-        """,
-            (int(exclude_card_id), int(document_id), int(k)),
-        )
-        out = [r["answer"] for r in cur.fetchall()]
+        if document_id is not None:
+            cand = list(dict.fromkeys(_random_answers(cur, exclude_card_id, document_id, 2 * k)))
+            out = random.sample(cand, min(k, len(cand)))
 
-    if len(out) < k:
-        cur.execute(
-            """
-        SELECT answer FROM study_cards
-        WHERE id != ?
-        ORDER BY RANDOM()
-        LIMIT ?
-        """,
-            (int(exclude_card_id), int(k - len(out))),
-        )
-        out.extend([r["answer"] for r in cur.fetchall()])
+        if len(out) < k:
+            cand = list(dict.fromkeys(_random_answers(cur, exclude_card_id, None, 2 * k)))
+            random.shuffle(cand)
+            out.extend(cand)
 
-    conn.close()
     # unique, keep order
     seen = set()
     uniq = []
@@ -405,171 +739,216 @@ def get_random_distractors(
     return uniq[:k]
 
 
-def review_card(card_id: int, correct: bool, source: str = "session") -> None:
-    """Updates SRS (Leitner) + logs a review."""
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT box, correct_streak FROM study_srs WHERE card_id=?", (int(card_id),))
-    row = cur.fetchone()
-    if not row:
-        # ensure srs row exists
-        cur.execute(
-            """
-        INSERT OR REPLACE INTO study_srs(card_id, box, due_at, last_review_at, correct_streak)
-        VALUES(?, 1, date('now'), NULL, 0)
-        """,
-            (int(card_id),),
-        )
-        box = 1
-        streak = 0
-    else:
-        box = int(row["box"])
-        streak = int(row["correct_streak"])
+# Ring buffer of the last _RECENT_REVIEWS results across all documents. review_card
+# writes slot seq % N, so the all-documents study_stats reads at most N rows instead
+# of walking study_reviews backwards. Per-document accuracy is not kept here: a card
+# can move to another document, so that case uses the indexed per-document query.
+_RECENT_REVIEWS = 50
 
-    if correct:
-        new_box = min(5, box + 1)
-        new_streak = streak + 1
-    else:
-        new_box = 1
-        new_streak = 0
 
-    interval = int(_LEITNER_INTERVALS_DAYS.get(new_box, 0))
+def _init_recent_reviews(cur: sqlite3.Cursor) -> None:
+    cur.execute("PRAGMA table_info(study_recent_reviews)")
+    cols = {r[1] for r in cur.fetchall()}
+    if "scope" in cols:
+        # older layout also kept per-document rings, which went stale on card moves
+        cur.execute("DROP TABLE study_recent_reviews")
+        cols = set()
     cur.execute(
-        """
-    UPDATE study_srs
-    SET box=?,
-        due_at=date('now', ?),
-        last_review_at=datetime('now'),
-        correct_streak=?
-    WHERE card_id=?
-    """,
-        (new_box, f"+{interval} day", new_streak, int(card_id)),
+        f"""
+    CREATE TABLE IF NOT EXISTS study_recent_reviews (
+      pos INTEGER PRIMARY KEY CHECK(pos < {_RECENT_REVIEWS}),
+      seq INTEGER NOT NULL,
+      review_id INTEGER NOT NULL,
+      correct INTEGER NOT NULL,
+      FOREIGN KEY(review_id) REFERENCES study_reviews(id) ON DELETE CASCADE
     )
+    """
+    )
+    if not cols:
+        _seed_recent_reviews(cur)
+
 
+def _seed_recent_reviews(cur: sqlite3.Cursor) -> None:
+    """Refill the ring from study_reviews: newest review gets seq N, the oldest kept one seq 1."""
+    cur.execute("DELETE FROM study_recent_reviews")
     cur.execute(
         """
-    INSERT INTO study_reviews(card_id, correct, source)
-    VALUES(?,?,?)
+    INSERT INTO study_recent_reviews(pos, seq, review_id, correct)
+    SELECT (:n + 1 - rn) % :n, :n + 1 - rn, id, correct
+    FROM (
+        SELECT id, correct, ROW_NUMBER() OVER (ORDER BY id DESC) AS rn
+        FROM study_reviews
+        ORDER BY id DESC
+        LIMIT :n
+    )
     """,
-        (int(card_id), 1 if correct else 0, (source or "session")),
+        {"n": _RECENT_REVIEWS},
     )
-    conn.commit()
-    conn.close()
 
 
-def study_stats(document_id: Optional[int] = None) -> Dict[str, Any]:
-    """Returns {total,due,dist,acc,weak}."""
-    total, due = get_study_counts(document_id)
-
-    conn = get_conn()
-    cur = conn.cursor()
+def review_card(card_id: int, correct: bool, source: str = "session") -> None:
+    """Updates SRS (Leitner) + logs a review (single transaction)."""
+    # a card without an srs row starts from box 1 / streak 0
+    fresh_box = 2 if correct else 1
+    params = {
+        "card_id": int(card_id),
+        "correct": 1 if correct else 0,
+        "fresh_box": fresh_box,
+        "fresh_due": f"+{int(_LEITNER_INTERVALS_DAYS.get(fresh_box, 0))} day",
+        "fresh_streak": 1 if correct else 0,
+        "source": (source or "session"),
+        "now": _now(),
+    }
+    with _checkout(write=True) as conn:
+        with conn:
+            conn.execute(
+                f"""
+            INSERT INTO study_srs(card_id, box, due_at, last_review_at, correct_streak)
+            VALUES(:card_id, :fresh_box, date(:now, :fresh_due), :now, :fresh_streak)
+            ON CONFLICT(card_id) DO UPDATE SET
+                box={_NEW_BOX_SQL},
+                due_at=date(:now, '+' || ({_NEW_INTERVAL_SQL}) || ' day'),
+                last_review_at=:now,
+                correct_streak=CASE WHEN :correct THEN correct_streak + 1 ELSE 0 END
+            """,
+                params,
+            )
+            params["review_id"] = conn.execute(
+                """
+            INSERT INTO study_reviews(card_id, correct, source, created_at)
+            VALUES(:card_id, :correct, :source, :now)
+            """,
+                params,
+            ).lastrowid
+            conn.execute(
+                """
+            INSERT OR REPLACE INTO study_recent_reviews(pos, seq, review_id, correct)
+            SELECT nxt % :n, nxt, :review_id, :correct
+            FROM (SELECT COALESCE(MAX(seq), 0) + 1 AS nxt FROM study_recent_reviews)
+            """,
+                {**params, "n": _RECENT_REVIEWS},
+            )
 
-    dist = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-    if document_id is None:
-        cur.execute("SELECT box, COUNT(*) AS n FROM study_srs GROUP BY box")
-    else:
-        cur.execute("""
-        SELECT s.box AS box, COUNT(*) AS n
-        FROM study_srs s
-        JOIN study_cards c ON c.id=s.card_id
-        WHERE c.document_id=?
-        GROUP BY s.box
-        """, (int(document_id),))
-    for r in cur.fetchall():
-        b = int(r["box"])
-        if b in dist:
-            dist[b] = int(r["n"])
 
+def study_stats(document_id: Optional[int] = None) -> Dict[str, Any]:
+    """Returns {total,due,dist,acc,weak}."""
+    params = {"doc": None if document_id is None else int(document_id), "today": _today()}
+    doc_sql = _doc_filter(document_id)
     if document_id is None:
-        cur.execute("SELECT correct FROM study_reviews ORDER BY id DESC LIMIT 50")
+        recent_sql = "SELECT correct FROM study_recent_reviews"
     else:
-        cur.execute("""
-        SELECT r.correct
-        FROM study_reviews r
-        JOIN study_cards c ON c.id=r.card_id
-        WHERE c.document_id=?
-        ORDER BY r.id DESC
-        LIMIT 50
-        """, (int(document_id),))
-    rows = cur.fetchall()
-    n = len(rows)
-    correct_n = sum(int(r["correct"]) for r in rows)
-    wrong_n = n - correct_n
-    rate = int(round((correct_n / n) * 100)) if n else 0
-    acc = {"n": n, "correct": correct_n, "wrong": wrong_n, "rate": rate}
-
-    # weak cards: box 1, earliest due, plus last result
-    if document_id is None:
+        recent_sql = f"""
+            SELECT r.correct FROM study_reviews r JOIN cards c ON c.id=r.card_id
+            ORDER BY r.id DESC
+            LIMIT {_RECENT_REVIEWS}"""
+    with _checkout() as conn:
+        cur = conn.cursor()
+
+        # counts + box distribution + last-50 accuracy in one statement
         cur.execute(
-            """
-    SELECT c.*, d.title AS document_title, s.box, s.due_at,
-           (SELECT r.correct FROM study_reviews r WHERE r.card_id=c.id ORDER BY r.id DESC LIMIT 1) AS last_result
-    FROM study_cards c
-    LEFT JOIN documents d ON d.id=c.document_id
-    LEFT JOIN study_srs s ON s.card_id=c.id
-    WHERE s.box=1
-    ORDER BY date(s.due_at) ASC, c.id DESC
-    LIMIT 12
-    """
+            f"""
+        WITH cards AS (
+            SELECT id FROM study_cards c WHERE 1{doc_sql}
+        ),
+        srs AS (
+            SELECT s.box, s.due_at FROM study_srs s JOIN cards c ON c.id=s.card_id
+        ),
+        recent AS (
+            {recent_sql}
         )
-    else:
+        SELECT (SELECT COUNT(*) FROM cards) AS total,
+               (SELECT COUNT(*) FROM srs WHERE due_at <= :today) AS due,
+               (SELECT json_group_object(box, n) FROM (SELECT box, COUNT(*) AS n FROM srs GROUP BY box)) AS dist,
+               (SELECT COUNT(*) FROM recent) AS acc_n,
+               (SELECT COALESCE(SUM(correct), 0) FROM recent) AS acc_correct
+        """,
+            params,
+        )
+        total, due, dist_json, n, correct_n = cur.fetchone()
+
+        dist = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+        for b, cnt in json.loads(dist_json or "{}").items():
+            if int(b) in dist:
+                dist[int(b)] = int(cnt)
+
+        wrong_n = n - correct_n
+        rate = int(round((correct_n / n) * 100)) if n else 0
+        acc = {"n": n, "correct": correct_n, "wrong": wrong_n, "rate": rate}
+
+        # weak cards: box 1, earliest due, plus last result (latest review per card)
         cur.execute(
-            """
-    SELECT c.*, d.title AS document_title, s.box, s.due_at,
-           (SELECT r.correct FROM study_reviews r WHERE r.card_id=c.id ORDER BY r.id DESC LIMIT 1) AS last_result
-    FROM study_cards c
-    LEFT JOIN documents d ON d.id=c.document_id
-    LEFT JOIN study_srs s ON s.card_id=c.id
-    WHERE s.box=1 AND c.document_id=?
-    ORDER BY date(s.due_at) ASC, c.id DESC
-    LIMIT 12
-    """,
-            (int(document_id),),
+            f"""
+        SELECT {_CARD_COLS}, d.title AS document_title, s.box, s.due_at, lr.correct AS last_result
+        FROM study_cards c
+        LEFT JOIN documents d ON d.id=c.document_id
+        LEFT JOIN study_srs s ON s.card_id=c.id
+        LEFT JOIN (
+            SELECT card_id, correct FROM study_reviews
+            WHERE id IN (SELECT MAX(id) FROM study_reviews GROUP BY card_id)
+        ) lr ON lr.card_id=c.id
+        WHERE s.box=1{doc_sql}
+        ORDER BY s.due_at ASC, c.id DESC
+        LIMIT 12
+        """,
+            params,
         )
-    weak = [dict(r) for r in cur.fetchall()]
+        weak = [_RowView(r) for r in cur.fetchall()]
 
-    conn.close()
     return {"total": total, "due": due, "dist": dist, "acc": acc, "weak": weak}
 
 
-def _set_default(cur: sqlite3.Cursor, key: str, value: str) -> None:
-    cur.execute("SELECT value FROM settings WHERE key = ?", (key,))
-    row = cur.fetchone()
-    if row is None:
-        cur.execute("INSERT INTO settings(key, value) VALUES(?, ?)", (key, value))
+# ---------- settings ----------
+# Settings change only via set_setting (or init_db defaults), so the whole table is
+# kept in memory after the first read. Writers bump _SETTINGS_VER after committing and
+# drop the snapshot; a reader only installs what it loaded if the version did not move
+# while it was reading (otherwise its rows may predate that commit). Snapshots are
+# never mutated, so get_all_settings can copy one without holding the lock.
+_SETTINGS_CACHE: Optional[Dict[str, str]] = None
+_SETTINGS_VER = 0
+_CACHE_LOCK = threading.Lock()
+
+
+def _invalidate_settings() -> None:
+    global _SETTINGS_CACHE, _SETTINGS_VER
+    with _CACHE_LOCK:
+        _SETTINGS_VER += 1
+        _SETTINGS_CACHE = None
+
+
+def _settings_cache() -> Dict[str, str]:
+    global _SETTINGS_CACHE
+    cache = _SETTINGS_CACHE
+    if cache is None:
+        ver = _SETTINGS_VER
+        with _checkout() as conn:
+            rows = conn.execute("SELECT key, value FROM settings").fetchall()
+        cache = {k: v for k, v in rows}
+        with _CACHE_LOCK:
+            if ver == _SETTINGS_VER and _SETTINGS_CACHE is None:
+                _SETTINGS_CACHE = cache
+    return cache
 
 
-# ---------- settings ----------
 def get_all_settings() -> Dict[str, str]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT key, value FROM settings")
-    rows = cur.fetchall()
-    conn.close()
-    return {r["key"]: r["value"] for r in rows}
+    return dict(_settings_cache())
 
 
 def get_setting(key: str, default: str = "") -> str:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT value FROM settings WHERE key = ?", (key,))
-    row = cur.fetchone()
-    conn.close()
-    return row["value"] if row else default
+    return _settings_cache().get(key, default)
 
 
 def set_setting(key: str, value: str) -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-    INSERT INTO settings(key, value) VALUES(?, ?)
-    ON CONFLICT(key) DO UPDATE SET value=excluded.value
-    """,
-        (key, value),
-    )
-    conn.commit()
-    conn.close()
+    with _checkout(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+        INSERT INTO settings(key, value) VALUES(?, ?)
+        ON CONFLICT(key) DO UPDATE SET value=excluded.value
+        """,
+            (key, value),
+        )
+        conn.commit()
+    _invalidate_settings()
 
 
 # ---------- documents ----------
@@ -582,166 +961,191 @@ def insert_document(
     doc_type: str,
     search_text: str,
 ) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-    INSERT INTO documents(title, original_name, stored_name, language, pages, doc_type, search_text)
-    VALUES(?,?,?,?,?,?,?)
-    """,
-        (title, original_name, stored_name, language, int(pages), doc_type, search_text),
-    )
-    conn.commit()
-    doc_id = cur.lastrowid
-    conn.close()
+    with _checkout(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+        INSERT INTO documents(title, original_name, stored_name, language, pages, doc_type, search_text)
+        VALUES(?,?,?,?,?,?,?)
+        """,
+            (title, original_name, stored_name, language, int(pages), doc_type, search_text),
+        )
+        conn.commit()
+        doc_id = cur.lastrowid
     return int(doc_id)
 
 
-def _doc_postprocess(d: Dict[str, Any]) -> Dict[str, Any]:
-    # Backwards-compat aliases for templates
-    if "doc_type" in d and "type" not in d:
-        d["type"] = d.get("doc_type")
-    if "pages" in d and "page_count" not in d:
-        d["page_count"] = d.get("pages")
-    return d
-
-
-def list_documents() -> List[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM documents ORDER BY id DESC")
-    rows = cur.fetchall()
-    conn.close()
-    return [_doc_postprocess(dict(r)) for r in rows]
+def list_documents(include_text: bool = False, limit: Optional[int] = None) -> List[_RowView]:
+    with _checkout() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"SELECT {_doc_cols(include_text)} FROM documents ORDER BY id DESC LIMIT ?",
+            (-1 if limit is None else int(limit),),
+        )
+        rows = cur.fetchall()
+    return [_DocRowView(r) for r in rows]
 
 
-def get_document(doc_id: int) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM documents WHERE id = ?", (int(doc_id),))
-    row = cur.fetchone()
-    conn.close()
-    return _doc_postprocess(dict(row)) if row else None
+def get_document(doc_id: int) -> Optional[_RowView]:
+    with _checkout() as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT {_doc_cols(True)} FROM documents WHERE id = ?", (int(doc_id),))
+        row = cur.fetchone()
+    return _DocRowView(row) if row else None
 
 
-def search_documents(q: str, limit: int = 8) -> List[Dict[str, Any]]:
-    q2 = f"%{(q or '').strip()}%"
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-    SELECT * FROM documents
-    WHERE title LIKE ? OR search_text LIKE ? OR original_name LIKE ?
-    ORDER BY id DESC
-    LIMIT ?
-    """,
-        (q2, q2, q2, int(limit)),
-    )
-    rows = cur.fetchall()
-    conn.close()
-    return [_doc_postprocess(dict(r)) for r in rows]
+def get_documents_by_ids(doc_ids: List[int], include_text: bool = False) -> Dict[int, _RowView]:
+    """Documents for several ids in one query, keyed by id (missing ids are absent)."""
+    ids = list(dict.fromkeys(int(i) for i in doc_ids))
+    if not ids:
+        return {}
+    with _checkout() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"SELECT {_doc_cols(include_text)} FROM documents WHERE id IN ({','.join('?' * len(ids))})",
+            ids,
+        )
+        rows = cur.fetchall()
+    return {int(r["id"]): _DocRowView(r) for r in rows}
+
+
+def search_documents(q: str, limit: int = 8, include_text: bool = False) -> List[_RowView]:
+    q = (q or "").strip()
+    phrase = _fts_phrase(q)
+    with _checkout() as conn:
+        cur = conn.cursor()
+        if phrase is not None:
+            cur.execute(
+                f"""
+            SELECT {_doc_cols(include_text, "d")} FROM documents_fts f
+            JOIN documents d ON d.id=f.rowid
+            WHERE documents_fts MATCH ?
+            ORDER BY f.rank
+            LIMIT ?
+            """,
+                (phrase, int(limit)),
+            )
+        else:
+            cur.execute(
+                f"""
+            SELECT {_doc_cols(include_text)} FROM documents
+            WHERE title LIKE '%' || :q || '%' OR search_text LIKE '%' || :q || '%'
+               OR original_name LIKE '%' || :q || '%'
+            ORDER BY id DESC
+            LIMIT :limit
+            """,
+                {"q": q, "limit": int(limit)},
+            )
+        rows = cur.fetchall()
+    return [_DocRowView(r) for r in rows]
 
 
 # ---------- notes ----------
 def insert_note(title: str, body: str, document_id: Optional[int] = None) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-    INSERT INTO notes(title, body, document_id)
-    VALUES(?,?,?)
-    """,
-        (title, body, document_id),
-    )
-    conn.commit()
-    nid = cur.lastrowid
-    conn.close()
-    return int(nid)
-
-
-def list_notes(limit: int = 50, document_id: Optional[int] = None) -> List[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.cursor()
-    if document_id is None:
-        cur.execute(
-            """
-        SELECT * FROM notes
-        ORDER BY id DESC
-        LIMIT ?
-        """,
-            (int(limit),),
-        )
-    else:
+    with _checkout(write=True) as conn:
+        cur = conn.cursor()
         cur.execute(
             """
-        SELECT * FROM notes
-        WHERE document_id=?
-        ORDER BY id DESC
-        LIMIT ?
+        INSERT INTO notes(title, body, document_id)
+        VALUES(?,?,?)
         """,
-            (int(document_id), int(limit)),
+            (title, body, document_id),
         )
-    rows = cur.fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+        conn.commit()
+        nid = cur.lastrowid
+    return int(nid)
 
 
-def get_note(note_id: int) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM notes WHERE id = ?", (int(note_id),))
-    row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+def list_notes(limit: int = 50, document_id: Optional[int] = None) -> List[_RowView]:
+    with _checkout() as conn:
+        cur = conn.cursor()
+        if document_id is None:
+            cur.execute(
+                f"""
+            SELECT {_cols(_NOTE_COLS)} FROM notes
+            ORDER BY id DESC
+            LIMIT ?
+            """,
+                (int(limit),),
+            )
+        else:
+            cur.execute(
+                f"""
+            SELECT {_cols(_NOTE_COLS)} FROM notes
+            WHERE document_id=?
+            ORDER BY id DESC
+            LIMIT ?
+            """,
+                (int(document_id), int(limit)),
+            )
+        rows = cur.fetchall()
+    return [_RowView(r) for r in rows]
+
+
+def get_note(note_id: int) -> Optional[_RowView]:
+    with _checkout() as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT {_cols(_NOTE_COLS)} FROM notes WHERE id = ?", (int(note_id),))
+        row = cur.fetchone()
+    return _RowView(row) if row else None
 
 
 def update_note(note_id: int, title: str, body: str, document_id: Optional[int]) -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-    UPDATE notes SET title=?, body=?, document_id=? WHERE id=?
-    """,
-        (title, body, document_id, int(note_id)),
-    )
-    conn.commit()
-    conn.close()
-
-
-def delete_note(note_id: int) -> None:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM notes WHERE id=?", (int(note_id),))
-    conn.commit()
-    conn.close()
-
-
-def search_notes(q: str, document_id: Optional[int] = None, limit: int = 12) -> List[Dict[str, Any]]:
-    q2 = f"%{(q or '').strip()}%"
-    conn = get_conn()
-    cur = conn.cursor()
-
-    if document_id is None:
+    with _checkout(write=True) as conn:
+        cur = conn.cursor()
         cur.execute(
             """
-        SELECT * FROM notes
-        WHERE title LIKE ? OR body LIKE ?
-        ORDER BY id DESC
-        LIMIT ?
+        UPDATE notes SET title=?, body=?, document_id=? WHERE id=?
         """,
-            (q2, q2, int(limit)),
-        )
-    else:
-        cur.execute(
-            """
-        SELECT * FROM notes
-        WHERE (title LIKE ? OR body LIKE ?) AND document_id=?
-        ORDER BY id DESC
-        LIMIT ?
-        """,
-            (q2, q2, int(document_id), int(limit)),
+            (title, body, document_id, int(note_id)),
         )
+        conn.commit()
 
-    rows = cur.fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+
+def delete_note(note_id: int) -> None:
+    with _checkout(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM notes WHERE id=?", (int(note_id),))
+        conn.commit()
+
+
+def search_notes(q: str, document_id: Optional[int] = None, limit: int = 12) -> List[_RowView]:
+    q = (q or "").strip()
+    phrase = _fts_phrase(q)
+    with _checkout() as conn:
+        cur = conn.cursor()
+
+        if phrase is not None:
+            cur.execute(
+                f"""
+            SELECT {_cols(_NOTE_COLS, "n")} FROM notes_fts f
+            JOIN notes n ON n.id=f.rowid
+            WHERE notes_fts MATCH ?{"" if document_id is None else " AND n.document_id=?"}
+            ORDER BY f.rank
+            LIMIT ?
+            """,
+                (phrase, *(() if document_id is None else (int(document_id),)), int(limit)),
+            )
+        elif document_id is None:
+            cur.execute(
+                f"""
+            SELECT {_cols(_NOTE_COLS)} FROM notes
+            WHERE title LIKE '%' || :q || '%' OR body LIKE '%' || :q || '%'
+            ORDER BY id DESC
+            LIMIT :limit
+            """,
+                {"q": q, "limit": int(limit)},
+            )
+        else:
+            cur.execute(
+                f"""
+            SELECT {_cols(_NOTE_COLS)} FROM notes
+            WHERE (title LIKE '%' || :q || '%' OR body LIKE '%' || :q || '%') AND document_id=:doc
+            ORDER BY id DESC
+            LIMIT :limit
+            """,
+                {"q": q, "doc": int(document_id), "limit": int(limit)},
+            )
+
+        rows = cur.fetchall()
+    return [_RowView(r) for r in rows]
@@ -1,10 +1,16 @@
 # tools.py
 from __future__ import annotations
 
+import functools
+import hashlib
 import io
+import os
 import re
+import threading
 import unicodedata
 import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import List, Tuple, Optional
 
@@ -28,6 +34,11 @@ try:  # PDF -> images
 except Exception:  # pragma: no cover
     fitz = None
 
+try:  # encrypt / strip metadata without a per-page rewrite (pypdf fallback)
+    import pikepdf
+except Exception:  # pragma: no cover
+    pikepdf = None
+
 import difflib
 
 
@@ -41,6 +52,15 @@ _SEP_PATTERNS = [
     r"\s*->\s*",
     r"\s*=>\s*",
 ]
+# Compiled at import. A line is split on the first pattern *in list order* that matches
+# (": " beats an earlier " - "), which one alternation can't express; _ANY_SEP_RE
+# rejects separator-less lines in a single scan and the ordered search runs only on hits.
+# It is the patterns' existence condition with the optional \s* dropped (":" or "="
+# anywhere, "->", or a dash with whitespace on both sides): no \s* to try at every
+# position, so most lines are rejected by a plain character scan.
+_SEP_RES = [re.compile(p) for p in _SEP_PATTERNS]
+_ANY_SEP_RE = re.compile(r"[:=]|->|\s[-–—]\s")
+_BULLET_RE = re.compile(r"^[\-*•\u2022\u25CF]+\s+")
 
 
 def extract_qa_pairs(note_body: str) -> List[Tuple[str, str]]:
@@ -55,37 +75,32 @@ def extract_qa_pairs(note_body: str) -> List[Tuple[str, str]]:
     lines = [ln.strip() for ln in text.split("\n")]
     lines = [ln for ln in lines if ln]
 
-    out: List[Tuple[str, str]] = []
-
-    # Q:/A: mode
+    # one pass; Q:/A: pairs are still listed before separator pairs
+    qa_out: List[Tuple[str, str]] = []
+    sep_out: List[Tuple[str, str]] = []
     pending_q: Optional[str] = None
     for ln in lines:
-        l = re.sub(r"^[\-*•\u2022\u25CF]+\s+", "", ln).strip()
+        l = _BULLET_RE.sub("", ln).strip()
         if not l:
             continue
-        if l.lower().startswith("q:"):
+
+        # Q:/A: mode
+        if l.startswith(("q:", "Q:")):
             pending_q = l[2:].strip()
             continue
-        if l.lower().startswith("a:") and pending_q:
-            a = l[2:].strip()
-            if pending_q and a:
-                out.append((pending_q, a))
-            pending_q = None
-            continue
-
-    # separator mode (line-by-line)
-    for ln in lines:
-        l = re.sub(r"^[\-*•\u2022\u25CF]+\s+", "", ln).strip()
-        if not l:
+        if l.startswith(("a:", "A:")):
+            if pending_q:
+                a = l[2:].strip()
+                if a:
+                    qa_out.append((pending_q, a))
+                pending_q = None
             continue
 
-        # skip Q:/A: tokens handled already
-        if l.lower().startswith("q:") or l.lower().startswith("a:"):
+        # separator mode: split on first matching separator
+        if not _ANY_SEP_RE.search(l):
             continue
-
-        # try split on first matching separator
-        for pat in _SEP_PATTERNS:
-            m = re.search(pat, l)
+        for rx in _SEP_RES:
+            m = rx.search(l)
             if not m:
                 continue
             left = l[: m.start()].strip()
@@ -93,13 +108,13 @@ def extract_qa_pairs(note_body: str) -> List[Tuple[str, str]]:
             if left and right:
                 # prevent obviously bad splits (super long "question")
                 if len(left) <= 180 and len(right) <= 4000:
-                    out.append((left, right))
+                    sep_out.append((left, right))
             break
 
     # de-dup (keep order)
     seen = set()
     uniq: List[Tuple[str, str]] = []
-    for q, a in out:
+    for q, a in qa_out + sep_out:
         key = (q.strip(), a.strip())
         if key in seen:
             continue
@@ -108,6 +123,17 @@ def extract_qa_pairs(note_body: str) -> List[Tuple[str, str]]:
     return uniq
 
 
+# After normalization the name is pure ASCII: one translate() pass maps whitespace to
+# "_", keeps [a-z0-9._-] and drops everything else (same result as the former
+# \s+ -> "_" and [^a-z0-9._-]+ -> "" substitutions, since runs of "_" collapse after).
+_FN_ALLOWED = frozenset("abcdefghijklmnopqrstuvwxyz0123456789._-")
+_FN_TRANS = str.maketrans(
+    {chr(i): ("_" if chr(i).isspace() else None) for i in range(128) if chr(i) not in _FN_ALLOWED}
+)
+_FN_UNDER_RE = re.compile(r"__+")
+
+
+@functools.lru_cache(maxsize=4096)  # pure function of short strings; names repeat a lot
 def safe_filename(name: str, fallback: str = "file.pdf") -> str:
     """
     Makes a filename safe for saving on filesystem.
@@ -117,21 +143,45 @@ def safe_filename(name: str, fallback: str = "file.pdf") -> str:
     if not name:
         return fallback
 
-    # normalize
-    name = unicodedata.normalize("NFKD", name)
-    name = name.encode("ascii", "ignore").decode("ascii")
+    # normalize (ASCII is already NFKD-stable: most uploads skip this)
+    if not name.isascii():
+        name = unicodedata.normalize("NFKD", name)
+        name = name.encode("ascii", "ignore").decode("ascii")
     name = name.lower()
 
     # replace spaces and invalid chars
-    name = re.sub(r"\s+", "_", name)
-    name = re.sub(r"[^a-z0-9._-]+", "", name)
-    name = re.sub(r"_+", "_", name).strip("._-")
+    name = name.translate(_FN_TRANS)
+    if "__" in name:
+        name = _FN_UNDER_RE.sub("_", name)
+    name = name.strip("._-")
 
     if not name:
         return fallback
     return name
 
 
+_IFIND_WINDOW = 1 << 16
+
+
+def _ifind(text: str, q: str) -> int:
+    """Case-insensitive text.find(q) without lower-casing the whole text up front.
+
+    ASCII: lower-cased window by window (overlapping by len(q)-1), stopping at the first
+    hit. Otherwise re's IGNORECASE scan, which also keeps offsets right when lower()
+    would change the length (e.g. 'İ').
+    """
+    if text.isascii() and q.isascii():
+        low_q = q.lower()
+        overlap = len(q) - 1
+        for start in range(0, len(text), _IFIND_WINDOW):
+            idx = text[start : start + _IFIND_WINDOW + overlap].lower().find(low_q)
+            if idx >= 0:
+                return start + idx
+        return -1
+    m = re.search(re.escape(q), text, re.IGNORECASE)
+    return m.start() if m else -1
+
+
 def make_snippet(text: str, q: str, radius: int = 80) -> str:
     """
     Returns a small snippet around the first occurrence of q in text.
@@ -143,9 +193,7 @@ def make_snippet(text: str, q: str, radius: int = 80) -> str:
     if not q2:
         return (t[:radius * 2] + "…") if len(t) > radius * 2 else t
 
-    low_t = t.lower()
-    low_q = q2.lower()
-    idx = low_t.find(low_q)
+    idx = _ifind(t, q2)
     if idx < 0:
         return (t[:radius * 2] + "…") if len(t) > radius * 2 else t
 
@@ -156,46 +204,133 @@ def make_snippet(text: str, q: str, radius: int = 80) -> str:
     return prefix + t[start:end].replace("\n", " ").strip() + suffix
 
 
+# Parse results keyed on a digest of the PDF bytes: re-uploads of the same file (and the
+# page count + text pass on every upload) skip pypdf. Only results are kept, never the PDF;
+# the text cache is capped both by entries and by total characters.
+_PARSE_CACHE_LOCK = threading.Lock()
+_TEXT_CACHE: "OrderedDict[Tuple[bytes, int], str]" = OrderedDict()
+_TEXT_CACHE_MAX = 64
+_TEXT_CACHE_MAX_CHARS = 32 * 1024 * 1024
+_text_cache_chars = 0
+_PAGES_CACHE: "OrderedDict[bytes, int]" = OrderedDict()
+_PAGES_CACHE_MAX = 512
+
+
+def _pdf_digest(pdf_bytes: bytes) -> bytes:
+    return hashlib.blake2b(pdf_bytes, digest_size=16).digest()
+
+
+def _pages_cache_put(key: bytes, n: int) -> None:
+    with _PARSE_CACHE_LOCK:
+        _PAGES_CACHE[key] = n
+        _PAGES_CACHE.move_to_end(key)
+        while len(_PAGES_CACHE) > _PAGES_CACHE_MAX:
+            _PAGES_CACHE.popitem(last=False)
+
+
+def _text_cache_put(key: Tuple[bytes, int], text: str) -> None:
+    global _text_cache_chars
+    if len(text) > _TEXT_CACHE_MAX_CHARS:
+        return
+    with _PARSE_CACHE_LOCK:
+        old = _TEXT_CACHE.pop(key, None)
+        if old is not None:
+            _text_cache_chars -= len(old)
+        _TEXT_CACHE[key] = text
+        _text_cache_chars += len(text)
+        while len(_TEXT_CACHE) > _TEXT_CACHE_MAX or _text_cache_chars > _TEXT_CACHE_MAX_CHARS:
+            _, dropped = _TEXT_CACHE.popitem(last=False)
+            _text_cache_chars -= len(dropped)
+
+
 def pdf_page_count(pdf_bytes: bytes) -> int:
+    key = _pdf_digest(pdf_bytes)
+    with _PARSE_CACHE_LOCK:
+        n = _PAGES_CACHE.get(key)
+        if n is not None:
+            _PAGES_CACHE.move_to_end(key)
+            return n
     reader = PdfReader(io.BytesIO(pdf_bytes))
-    return len(reader.pages)
+    n = len(reader.pages)
+    _pages_cache_put(key, n)
+    return n
 
 
 def extract_text_from_pdf(pdf_bytes: bytes, max_pages: int = 25) -> str:
     """
-    Simple text extraction from PDF (pypdf).
+    Simple text extraction from PDF (PyMuPDF if installed, else pypdf).
     Good for text-based PDFs; scanned PDFs -> OCR later.
     """
-    reader = PdfReader(io.BytesIO(pdf_bytes))
-    out = []
-    for i, page in enumerate(reader.pages[:max_pages]):
+    digest = _pdf_digest(pdf_bytes)
+    key = (digest, int(max_pages))
+    with _PARSE_CACHE_LOCK:
+        text = _TEXT_CACHE.get(key)
+        if text is not None:
+            _TEXT_CACHE.move_to_end(key)
+            return text
+
+    if fitz is not None:
+        # MuPDF's extractor is C and several times faster than pypdf's. Pages stay
+        # serial: fitz keeps the GIL and a document must not be shared across threads.
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
         try:
-            out.append(page.extract_text() or "")
-        except Exception:
-            out.append("")
-    return "\n".join(out).strip()
+            out = []
+            for i in range(min(int(max_pages), doc.page_count)):
+                try:
+                    out.append(doc.load_page(i).get_text("text") or "")
+                except Exception:
+                    out.append("")
+            total = doc.page_count
+        finally:
+            doc.close()
+    else:
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        out = []
+        for i, page in enumerate(reader.pages[:max_pages]):
+            try:
+                out.append(page.extract_text() or "")
+            except Exception:
+                out.append("")
+        total = len(reader.pages)
+    text = "\n".join(out).strip()
+
+    # the document is open anyway: the page count comes for free
+    _pages_cache_put(digest, total)
+    _text_cache_put(key, text)
+    return text
+
+
+def _writer_bytes(writer: PdfWriter) -> bytes:
+    """Serialize a writer to bytes.
+
+    Every caller needs the whole file (page count, text, storing), so there is nothing
+    to stream; a fresh BytesIO's getvalue() hands its buffer over without a copy
+    (bytes(buf.getbuffer()) or a reused buffer would add one).
+    """
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
 
 
-def compress_pdf_bytes(pdf_bytes: bytes) -> bytes:
+def compress_pdf_bytes(pdf_bytes: bytes, *, high_compression: bool = False) -> bytes:
     """
     Basic compression: re-write PDF and compress content streams.
     Not guaranteed huge savings, but usually helps a bit.
+    high_compression: deflate at zlib level 9 (smallest output, a bit more CPU).
     """
     reader = PdfReader(io.BytesIO(pdf_bytes))
-    writer = PdfWriter()
+    # one clone of the whole document instead of an add_page() copy per page
+    writer = PdfWriter(clone_from=reader)
 
-    for p in reader.pages:
-        writer.add_page(p)
+    # compress streams if possible (a page method: PdfWriter itself has none)
+    level = 9 if high_compression else -1
+    for page in writer.pages:
+        try:
+            page.compress_content_streams(level=level)
+        except Exception:
+            pass
 
-    # compress streams if possible
-    try:
-        writer.compress_content_streams()
-    except Exception:
-        pass
-
-    buf = io.BytesIO()
-    writer.write(buf)
-    return buf.getvalue()
+    return _writer_bytes(writer)
 
 
 def split_pdf_bytes(pdf_bytes: bytes,
@@ -205,7 +340,9 @@ def split_pdf_bytes(pdf_bytes: bytes,
     returns list of (filename, pdf_bytes)
     """
     reader = PdfReader(io.BytesIO(pdf_bytes))
-    total = len(reader.pages)
+    # resolve the page tree once; every range slices the same page objects
+    pages = list(reader.pages)
+    total = len(pages)
 
     outputs: List[Tuple[str, bytes]] = []
     for idx, (a, b) in enumerate(ranges, start=1):
@@ -215,16 +352,37 @@ def split_pdf_bytes(pdf_bytes: bytes,
             continue
 
         writer = PdfWriter()
-        for p in range(a - 1, b):
-            writer.add_page(reader.pages[p])
+        for page in pages[a - 1 : b]:
+            writer.add_page(page)
 
-        buf = io.BytesIO()
-        writer.write(buf)
-        outputs.append((f"split_{idx}_{a}-{b}.pdf", buf.getvalue()))
+        outputs.append((f"split_{idx}_{a}-{b}.pdf", _writer_bytes(writer)))
 
     return outputs
 
 
+_PAGE_TOKEN_RE = re.compile(r"\s*(\d+)\s*(?:-\s*(\d+)\s*)?")
+_PAGE_SEP_RE = re.compile(r"[,;]")
+
+
+def _page_tokens(text: str) -> List[Tuple[int, int]]:
+    """(a, b) per token with 1 <= a <= b; ValueError on anything else."""
+    out: List[Tuple[int, int]] = []
+    for p in _PAGE_SEP_RE.split(text or ""):
+        if not p.strip():
+            continue
+        m = _PAGE_TOKEN_RE.fullmatch(p)
+        if m is None:
+            raise ValueError(f"Invalid range token: {p.strip()!r}")
+        a = int(m[1])
+        b = int(m[2]) if m[2] else a
+        if a <= 0 or b <= 0:
+            raise ValueError("Page numbers must be >= 1")
+        if a > b:
+            a, b = b, a
+        out.append((a, b))
+    return out
+
+
 def parse_ranges(ranges_text: str) -> List[Tuple[int, int]]:
     """
     Parses 1-based inclusive page ranges.
@@ -233,35 +391,7 @@ def parse_ranges(ranges_text: str) -> List[Tuple[int, int]]:
       "1-3, 5, 7-10" -> [(1,3),(5,5),(7,10)]
       " 2 ; 4-6 "    -> [(2,2),(4,6)]
     """
-    s = (ranges_text or "").strip()
-    if not s:
-        return []
-
-    # allow ";" as separator too
-    s = s.replace(";", ",")
-    parts = [p.strip() for p in s.split(",") if p.strip()]
-
-    out: List[Tuple[int, int]] = []
-    for p in parts:
-        if "-" in p:
-            x, y = p.split("-", 1)
-            x = x.strip()
-            y = y.strip()
-            if not x or not y:
-                raise ValueError(f"Invalid range token: {p!r}")
-            a = int(x)
-            b = int(y)
-            if a <= 0 or b <= 0:
-                raise ValueError("Page numbers must be >= 1")
-            if a > b:
-                a, b = b, a
-            out.append((a, b))
-        else:
-            n = int(p)
-            if n <= 0:
-                raise ValueError("Page numbers must be >= 1")
-            out.append((n, n))
-    return out
+    return _page_tokens(ranges_text)
 
 
 def merge_pdf_bytes(pdf_list: List[bytes]) -> bytes:
@@ -272,9 +402,21 @@ def merge_pdf_bytes(pdf_list: List[bytes]) -> bytes:
         for p in reader.pages:
             writer.add_page(p)
 
-    buf = io.BytesIO()
-    writer.write(buf)
-    return buf.getvalue()
+    return _writer_bytes(writer)
+
+
+def _merge_page_spans(ranges: List[Tuple[int, int]], total: int) -> List[Tuple[int, int]]:
+    """Clamp 1-based inclusive ranges to 1..total, sort and merge overlapping/adjacent ones."""
+    spans: List[Tuple[int, int]] = []
+    for a, b in sorted((max(1, int(a)), min(total, int(b))) for a, b in ranges):
+        if a > b:
+            continue
+        if spans and a <= spans[-1][1] + 1:
+            if b > spans[-1][1]:
+                spans[-1] = (spans[-1][0], b)
+        else:
+            spans.append((a, b))
+    return spans
 
 
 def delete_pages_pdf_bytes(pdf_bytes: bytes, ranges: List[Tuple[int, int]]) -> bytes:
@@ -282,26 +424,26 @@ def delete_pages_pdf_bytes(pdf_bytes: bytes, ranges: List[Tuple[int, int]]) -> b
     reader = PdfReader(io.BytesIO(pdf_bytes))
     total = len(reader.pages)
 
-    to_delete = set()
-    for a, b in ranges:
-        a = max(1, int(a))
-        b = min(total, int(b))
-        for i in range(a, b + 1):
-            to_delete.add(i)
-
-    writer = PdfWriter()
-    for idx, page in enumerate(reader.pages, start=1):
-        if idx in to_delete:
-            continue
-        writer.add_page(page)
+    spans = _merge_page_spans(ranges, total)
 
     # don't output an empty PDF
-    if len(writer.pages) == 0:
+    if sum(b - a + 1 for a, b in spans) >= total:
         return pdf_bytes
 
-    buf = io.BytesIO()
-    writer.write(buf)
-    return buf.getvalue()
+    # copy only the kept pages: with clone_from + del writer.pages[i], pypdf 4.2 still
+    # writes the deleted pages' content streams and resources (orphans are kept), so
+    # their text would ship in the "deleted" output
+    writer = PdfWriter()
+    pages = reader.pages
+    prev = 0
+    for a, b in spans:
+        for idx in range(prev, a - 1):
+            writer.add_page(pages[idx])
+        prev = b
+    for idx in range(prev, total):
+        writer.add_page(pages[idx])
+
+    return _writer_bytes(writer)
 
 
 def rotate_pages_pdf_bytes(pdf_bytes: bytes, ranges: List[Tuple[int, int]], degrees: int) -> bytes:
@@ -313,16 +455,14 @@ def rotate_pages_pdf_bytes(pdf_bytes: bytes, ranges: List[Tuple[int, int]], degr
     reader = PdfReader(io.BytesIO(pdf_bytes))
     total = len(reader.pages)
 
-    to_rotate = set()
-    for a, b in ranges:
-        a = max(1, int(a))
-        b = min(total, int(b))
-        for i in range(a, b + 1):
-            to_rotate.add(i)
-
+    # copy the pages, then rotate the writer's copies (clone_from would also carry
+    # document-level objects over: a few hundred bytes more than the plain page copy)
     writer = PdfWriter()
-    for idx, page in enumerate(reader.pages, start=1):
-        if idx in to_rotate:
+    for page in reader.pages:
+        writer.add_page(page)
+    for a, b in _merge_page_spans(ranges, total):
+        for idx in range(a, b + 1):
+            page = writer.pages[idx - 1]
             try:
                 page.rotate(deg)
             except Exception:
@@ -331,11 +471,8 @@ def rotate_pages_pdf_bytes(pdf_bytes: bytes, ranges: List[Tuple[int, int]], degr
                     page.rotate_clockwise(deg)
                 except Exception:
                     pass
-        writer.add_page(page)
 
-    buf = io.BytesIO()
-    writer.write(buf)
-    return buf.getvalue()
+    return _writer_bytes(writer)
 
 
 def parse_page_sequence(sequence_text: str, total_pages: int) -> List[int]:
@@ -349,37 +486,12 @@ def parse_page_sequence(sequence_text: str, total_pages: int) -> List[int]:
 
     Raises ValueError on invalid tokens or out-of-range pages.
     """
-    s = (sequence_text or "").strip()
-    if not s:
-        return []
-
-    s = s.replace(";", ",")
-    parts = [p.strip() for p in s.split(",") if p.strip()]
-
     seq: List[int] = []
-    for p in parts:
-        if "-" in p:
-            x, y = p.split("-", 1)
-            x = x.strip()
-            y = y.strip()
-            if not x or not y:
-                raise ValueError(f"Invalid range token: {p!r}")
-            a = int(x)
-            b = int(y)
-            if a <= 0 or b <= 0:
-                raise ValueError("Page numbers must be >= 1")
-            if a > b:
-                a, b = b, a
-            for n in range(a, b + 1):
-                if n < 1 or n > total_pages:
-                    raise ValueError(f"Page {n} out of range (1..{total_pages})")
-                seq.append(n)
-        else:
-            n = int(p)
-            if n < 1 or n > total_pages:
-                raise ValueError(f"Page {n} out of range (1..{total_pages})")
-            seq.append(n)
-
+    for a, b in _page_tokens(sequence_text):
+        if b > total_pages:
+            # first page of the token past the end
+            raise ValueError(f"Page {max(a, total_pages + 1)} out of range (1..{total_pages})")
+        seq.extend(range(a, b + 1))
     return seq
 
 
@@ -388,8 +500,11 @@ def extract_pages_pdf_bytes(pdf_bytes: bytes, ranges: List[Tuple[int, int]]) ->
     Extract pages given by inclusive ranges, keeping natural order.
     """
     reader = PdfReader(io.BytesIO(pdf_bytes))
-    total = len(reader.pages)
-    seq: List[int] = []
+    pages = list(reader.pages)
+    total = len(pages)
+
+    # copy whole intervals; no per-page number list
+    writer = PdfWriter()
     for a, b in ranges:
         a = int(a)
         b = int(b)
@@ -399,20 +514,13 @@ def extract_pages_pdf_bytes(pdf_bytes: bytes, ranges: List[Tuple[int, int]]) ->
             a, b = b, a
         if a > total:
             continue
-        b = min(b, total)
-        for n in range(a, b + 1):
-            seq.append(n)
+        for page in pages[a - 1 : min(b, total)]:
+            writer.add_page(page)
 
-    if not seq:
+    if len(writer.pages) == 0:
         raise ValueError("No pages selected")
 
-    writer = PdfWriter()
-    for n in seq:
-        writer.add_page(reader.pages[n - 1])
-
-    buf = io.BytesIO()
-    writer.write(buf)
-    return buf.getvalue()
+    return _writer_bytes(writer)
 
 
 def reorder_pages_pdf_bytes(pdf_bytes: bytes, sequence: List[int]) -> bytes:
@@ -431,9 +539,7 @@ def reorder_pages_pdf_bytes(pdf_bytes: bytes, sequence: List[int]) -> bytes:
             raise ValueError(f"Page {n} out of range (1..{total})")
         writer.add_page(reader.pages[n - 1])
 
-    buf = io.BytesIO()
-    writer.write(buf)
-    return buf.getvalue()
+    return _writer_bytes(writer)
 
 
 # ---------------- PDF Extras (Watermark, Page Numbers, Images, Compare) ----------------
@@ -459,26 +565,29 @@ def add_text_watermark_pdf_bytes(
     reader = PdfReader(io.BytesIO(pdf_bytes))
     writer = PdfWriter()
 
+    # the overlay only depends on the page size: built once per distinct size
+    overlays = {}
+    alpha = max(0.02, min(float(opacity), 0.6))
     for page in reader.pages:
         w = float(page.mediabox.width)
         h = float(page.mediabox.height)
 
-        # create overlay
-        buf = io.BytesIO()
-        c = _rl_canvas.Canvas(buf, pagesize=(w, h))
-        alpha = max(0.02, min(float(opacity), 0.6))
-        c.setFillColor(_rl_Color(0, 0, 0, alpha=alpha))
-        c.setFont("Helvetica", int(font_size))
-        c.saveState()
-        c.translate(w / 2.0, h / 2.0)
-        c.rotate(int(rotation))
-        c.drawCentredString(0, 0, text)
-        c.restoreState()
-        c.showPage()
-        c.save()
-        buf.seek(0)
+        overlay = overlays.get((w, h))
+        if overlay is None:
+            buf = io.BytesIO()
+            c = _rl_canvas.Canvas(buf, pagesize=(w, h))
+            c.setFillColor(_rl_Color(0, 0, 0, alpha=alpha))
+            c.setFont("Helvetica", int(font_size))
+            c.saveState()
+            c.translate(w / 2.0, h / 2.0)
+            c.rotate(int(rotation))
+            c.drawCentredString(0, 0, text)
+            c.restoreState()
+            c.showPage()
+            c.save()
+            buf.seek(0)
+            overlay = overlays[(w, h)] = PdfReader(buf).pages[0]
 
-        overlay = PdfReader(buf).pages[0]
         try:
             page.merge_page(overlay)
         except Exception:
@@ -486,9 +595,7 @@ def add_text_watermark_pdf_bytes(
             page.mergePage(overlay)
         writer.add_page(page)
 
-    out = io.BytesIO()
-    writer.write(out)
-    return out.getvalue()
+    return _writer_bytes(writer)
 
 
 def add_page_numbers_pdf_bytes(
@@ -508,6 +615,11 @@ def add_page_numbers_pdf_bytes(
     total = len(reader.pages)
     writer = PdfWriter()
 
+    # The labels differ per page, but they all go on one canvas (one overlay page per
+    # source page), so reportlab renders and pypdf parses a single overlay document.
+    buf = io.BytesIO()
+    c = _rl_canvas.Canvas(buf)
+    alpha = max(0.2, min(float(opacity), 1.0))
     for idx, page in enumerate(reader.pages, start=0):
         w = float(page.mediabox.width)
         h = float(page.mediabox.height)
@@ -515,26 +627,23 @@ def add_page_numbers_pdf_bytes(
         n = int(start_at) + idx
         label = template.format(n=n, total=total)
 
-        buf = io.BytesIO()
-        c = _rl_canvas.Canvas(buf, pagesize=(w, h))
-        alpha = max(0.2, min(float(opacity), 1.0))
+        c.setPageSize((w, h))
         c.setFillColor(_rl_Color(0, 0, 0, alpha=alpha))
         c.setFont("Helvetica", int(font_size))
         c.drawCentredString(w / 2.0, int(y), label)
         c.showPage()
-        c.save()
-        buf.seek(0)
+    c.save()
+    buf.seek(0)
+    overlays = PdfReader(buf).pages
 
-        overlay = PdfReader(buf).pages[0]
+    for page, overlay in zip(reader.pages, overlays):
         try:
             page.merge_page(overlay)
         except Exception:
             page.mergePage(overlay)
         writer.add_page(page)
 
-    out = io.BytesIO()
-    writer.write(out)
-    return out.getvalue()
+    return _writer_bytes(writer)
 
 
 def images_to_pdf_bytes(images: List[Tuple[str, bytes]]) -> bytes:
@@ -547,22 +656,50 @@ def images_to_pdf_bytes(images: List[Tuple[str, bytes]]) -> bytes:
     if not images:
         raise ValueError("Nincs feltöltött kép")
 
-    pil_images = []
+    # One image decoded at a time: each becomes its own small (already encoded) PDF and
+    # the pages are merged at the end, instead of keeping every pixel buffer alive until
+    # a single save_all call. RGB and grayscale embed as-is (grayscale as DeviceGray).
+    parts: List[bytes] = []
     for name, bts in images:
         try:
             im = Image.open(io.BytesIO(bts))
-            if im.mode in ("RGBA", "P"):
+            if im.mode not in ("RGB", "L"):
                 im = im.convert("RGB")
-            elif im.mode != "RGB":
-                im = im.convert("RGB")
-            pil_images.append(im)
+            buf = io.BytesIO()
+            im.save(buf, format="PDF", save_all=True)
         except Exception as e:
             raise ValueError(f"Nem tudom megnyitni a képet: {name} ({e})")
+        parts.append(buf.getvalue())
+
+    if len(parts) == 1:
+        return parts[0]
+    return merge_pdf_bytes(parts)
+
+
+# PyMuPDF holds the GIL while rendering and a document must not be shared between
+# threads, so pages are rendered in worker processes, each opening its own copy and
+# taking a contiguous block of pages. Small exports stay in-process (spawn cost).
+_RENDER_WORKERS = min(4, os.cpu_count() or 1)
+_RENDER_PARALLEL_MIN_PAGES = 8
+_render_pool: Optional[ProcessPoolExecutor] = None
+_render_pool_lock = threading.Lock()
+
 
-    first, rest = pil_images[0], pil_images[1:]
-    out = io.BytesIO()
-    first.save(out, format="PDF", save_all=True, append_images=rest)
-    return out.getvalue()
+def _get_render_pool() -> ProcessPoolExecutor:
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ProcessPoolExecutor(max_workers=_RENDER_WORKERS)
+        return _render_pool
+
+
+def _render_page_block(pdf_bytes: bytes, start: int, stop: int, scale: float, ext: str) -> List[bytes]:
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        mat = fitz.Matrix(scale, scale)
+        return [doc.load_page(i).get_pixmap(matrix=mat, alpha=False).tobytes(ext) for i in range(start, stop)]
+    finally:
+        doc.close()
 
 
 def pdf_to_images_zip_bytes(
@@ -585,21 +722,30 @@ def pdf_to_images_zip_bytes(
 
     doc = fitz.open(stream=pdf_bytes, filetype="pdf")
     page_count = doc.page_count
+    doc.close()
     if page_count == 0:
         raise ValueError("Üres PDF")
 
     limit = min(int(max_pages), page_count)
     scale = max(0.5, min(float(dpi) / 72.0, 6.0))
-    mat = fitz.Matrix(scale, scale)
+    ext = "png" if fmt2 == "png" else "jpg"
+
+    if _RENDER_WORKERS > 1 and limit >= _RENDER_PARALLEL_MIN_PAGES:
+        step = -(-limit // _RENDER_WORKERS)
+        pool = _get_render_pool()
+        futures = [
+            pool.submit(_render_page_block, bytes(pdf_bytes), i, min(i + step, limit), scale, ext)
+            for i in range(0, limit, step)
+        ]
+        images = [img for fut in futures for img in fut.result()]
+    else:
+        images = _render_page_block(pdf_bytes, 0, limit, scale, ext)
 
     out_zip = io.BytesIO()
     with zipfile.ZipFile(out_zip, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for i in range(limit):
-            page = doc.load_page(i)
-            pix = page.get_pixmap(matrix=mat, alpha=False)
-            ext = "png" if fmt2 == "png" else "jpg"
-            img_bytes = pix.tobytes(ext)
-            zf.writestr(f"page_{i+1:03d}.{ext}", img_bytes)
+        # PNG/JPEG are already compressed: deflating them again costs CPU for ~0 bytes
+        for i, img_bytes in enumerate(images):
+            zf.writestr(f"page_{i+1:03d}.{ext}", img_bytes, compress_type=zipfile.ZIP_STORED)
 
         # helpful info file
         zf.writestr(
@@ -610,6 +756,55 @@ def pdf_to_images_zip_bytes(
     return out_zip.getvalue()
 
 
+_COMPARE_RATIO_MAX_CHARS = 200_000
+
+
+def _line_matcher(a_lines: List[str], b_lines: List[str]) -> difflib.SequenceMatcher:
+    """SequenceMatcher over small int line ids instead of the (long) line strings.
+
+    Each distinct line gets an id once (exact, no hash collisions); equal ids <=> equal
+    lines, so the opcodes are the same as matching the strings themselves.
+    """
+    ids: dict = {}
+    ia = [ids.setdefault(ln, len(ids)) for ln in a_lines]
+    ib = [ids.setdefault(ln, len(ids)) for ln in b_lines]
+    return difflib.SequenceMatcher(None, ia, ib)
+
+
+def _unified_line_diff(
+    sm: difflib.SequenceMatcher, a_lines: List[str], b_lines: List[str], *, fromfile: str, tofile: str, n: int
+) -> List[str]:
+    """difflib.unified_diff(..., lineterm="") output from a _line_matcher; the text is
+    only pulled back in for the emitted hunks."""
+
+    def _range(start: int, stop: int) -> str:
+        length = stop - start
+        if length == 1:
+            return f"{start + 1}"
+        return f"{start + 1 if length else start},{length}"
+
+    out: List[str] = []
+    for group in sm.get_grouped_opcodes(n):
+        if not out:
+            out.append(f"--- {fromfile}")
+            out.append(f"+++ {tofile}")
+        first, last = group[0], group[-1]
+        out.append(f"@@ -{_range(first[1], last[2])} +{_range(first[3], last[4])} @@")
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                out.extend(" " + ln for ln in a_lines[i1:i2])
+                continue
+            if tag in ("replace", "delete"):
+                out.extend("-" + ln for ln in a_lines[i1:i2])
+            if tag in ("replace", "insert"):
+                out.extend("+" + ln for ln in b_lines[j1:j2])
+    return out
+
+
+# below this share of possibly-matching lines the diff would only list both texts
+_COMPARE_DISJOINT_RATIO = 0.01
+
+
 def compare_pdfs_text_summary(
     pdf_a: bytes,
     pdf_b: bytes,
@@ -621,6 +816,8 @@ def compare_pdfs_text_summary(
 
     Extracts text from first N pages, then produces a unified diff summary.
     Scanned PDFs without embedded text will produce weak results.
+    Both texts come from the extraction cache, so comparing against an uploaded
+    document (or re-running a compare) does not re-parse either PDF.
     """
     a = extract_text_from_pdf(pdf_a, max_pages=max_pages)
     b = extract_text_from_pdf(pdf_b, max_pages=max_pages)
@@ -628,24 +825,30 @@ def compare_pdfs_text_summary(
     a_lines = (a or "").splitlines()
     b_lines = (b or "").splitlines()
 
-    ratio = difflib.SequenceMatcher(None, a, b).ratio() if (a or b) else 1.0
-
-    diff = list(
-        difflib.unified_diff(
-            a_lines,
-            b_lines,
-            fromfile="A",
-            tofile="B",
-            lineterm="",
-            n=2,
-        )
-    )
+    # Identical text (same file uploaded twice, or no text at all): nothing to diff.
+    # Otherwise the character-level ratio is O(n*m) worst case, so it only looks at a prefix.
+    ratio_note = ""
+    if a == b:
+        ratio = 1.0
+        diff = []
+    else:
+        cap = _COMPARE_RATIO_MAX_CHARS
+        if len(a) > cap or len(b) > cap:
+            ratio_note = f" (első {cap} karakter alapján)"
+        ratio = difflib.SequenceMatcher(None, a[:cap], b[:cap]).ratio()
+        # cheap upper bounds first (line counts, then line multisets): when (almost) no
+        # line can match, skip the matching and say so instead of listing both texts
+        sm = _line_matcher(a_lines, b_lines)
+        if sm.real_quick_ratio() < _COMPARE_DISJOINT_RATIO or sm.quick_ratio() < _COMPARE_DISJOINT_RATIO:
+            diff = ["⚠️ A két szöveg sorai szinte teljesen eltérnek (< 1% közös sor), részletes diff kihagyva."]
+        else:
+            diff = _unified_line_diff(sm, a_lines, b_lines, fromfile="A", tofile="B", n=2)
 
     header = [
         f"Text compare (első {max_pages} oldal)",
         f"A: {len(a)} karakter | {len(a_lines)} sor",
         f"B: {len(b)} karakter | {len(b_lines)} sor",
-        f"Hasonlóság (0..1): {ratio:.3f}",
+        f"Hasonlóság (0..1): {ratio:.3f}{ratio_note}",
         "",
     ]
 
@@ -660,17 +863,23 @@ def compare_pdfs_text_summary(
 
 
 def encrypt_pdf_bytes(pdf_bytes: bytes, password: str) -> bytes:
-    """Encrypt PDF with a user password (simple)."""
+    """Encrypt PDF with a user password (simple).
+
+    With pikepdf (qpdf) the file is re-saved structurally with AES-256; pypdf otherwise.
+    """
     pw = (password or "").strip()
     if not pw:
         raise ValueError("Jelszó üres")
+    buf = io.BytesIO()
+    if pikepdf is not None:
+        with pikepdf.open(io.BytesIO(pdf_bytes)) as pdf:
+            pdf.save(buf, encryption=pikepdf.Encryption(user=pw, owner=pw, R=6))
+        return buf.getvalue()
+
     reader = PdfReader(io.BytesIO(pdf_bytes))
-    writer = PdfWriter()
-    for p in reader.pages:
-        writer.add_page(p)
+    writer = PdfWriter(clone_from=reader)
     # 128-bit is default in modern pypdf
     writer.encrypt(pw)
-    buf = io.BytesIO()
     writer.write(buf)
     return buf.getvalue()
 
@@ -679,11 +888,23 @@ def strip_pdf_metadata_bytes(pdf_bytes: bytes) -> bytes:
     """Rewrite PDF without copying metadata.
 
     Note: this is a pragmatic approach; some PDFs may still contain embedded XMP.
+    With pikepdf the document info and the catalog XMP stream are dropped from the
+    otherwise unchanged file (bookmarks etc. survive). The pypdf fallback copies pages
+    one by one on purpose: clone_from would carry /Info over too.
     """
+    buf = io.BytesIO()
+    if pikepdf is not None:
+        with pikepdf.open(io.BytesIO(pdf_bytes)) as pdf:
+            if "/Info" in pdf.trailer:
+                del pdf.trailer.Info
+            if "/Metadata" in pdf.Root:
+                del pdf.Root.Metadata
+            pdf.save(buf)
+        return buf.getvalue()
+
     reader = PdfReader(io.BytesIO(pdf_bytes))
     writer = PdfWriter()
     for p in reader.pages:
         writer.add_page(p)
-    buf = io.BytesIO()
     writer.write(buf)
     return buf.getvalue()
@@ -1,14 +1,28 @@
 # tools.py
 from __future__ import annotations
 
+import contextlib
+import functools
 import io
+import mmap
 import re
+import threading
 import unicodedata
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Iterator, List, Tuple, Optional
 
 from pypdf import PdfReader, PdfWriter
 
+try:  # qpdf-backed rewrites (compression); pypdf is the fallback
+    import pikepdf
+except Exception:  # pragma: no cover
+    pikepdf = None
+
+try:  # C text extraction; pypdf is the fallback
+    import fitz  # PyMuPDF
+except Exception:  # pragma: no cover
+    fitz = None
+
 
 # ---------------- Study helpers ----------------
 _SEP_PATTERNS = [
@@ -87,6 +101,23 @@ def extract_qa_pairs(note_body: str) -> List[Tuple[str, str]]:
     return uniq
 
 
+# Applied after the ASCII fold, so 128 entries cover every input char: lower-cases,
+# maps whitespace to "_" and drops anything outside [a-z0-9._-] in a single C pass
+# (runs of "_" are collapsed afterwards, which makes it equal to the former \s+ -> "_"
+# and [^a-z0-9._-]+ -> "" substitutions).
+_FN_ALLOWED = frozenset("abcdefghijklmnopqrstuvwxyz0123456789._-")
+_FN_TABLE = str.maketrans(
+    {
+        chr(i): (
+            chr(i).lower() if chr(i).lower() in _FN_ALLOWED else ("_" if chr(i).isspace() else None)
+        )
+        for i in range(128)
+        if chr(i) not in _FN_ALLOWED
+    }
+)
+_RE_UNDER = re.compile(r"__+")
+
+
 def safe_filename(name: str, fallback: str = "file.pdf") -> str:
     """
     Makes a filename safe for saving on filesystem.
@@ -96,21 +127,49 @@ def safe_filename(name: str, fallback: str = "file.pdf") -> str:
     if not name:
         return fallback
 
-    # normalize
-    name = unicodedata.normalize("NFKD", name)
-    name = name.encode("ascii", "ignore").decode("ascii")
-    name = name.lower()
+    # normalize (ASCII is already NFKD-stable: most upload names skip the round-trip)
+    if not name.isascii():
+        name = unicodedata.normalize("NFKD", name)
+        name = name.encode("ascii", "ignore").decode("ascii")
 
-    # replace spaces and invalid chars
-    name = re.sub(r"\s+", "_", name)
-    name = re.sub(r"[^a-z0-9._-]+", "", name)
-    name = re.sub(r"_+", "_", name).strip("._-")
+    # lower-case, replace spaces and drop invalid chars
+    name = name.translate(_FN_TABLE)
+    if "__" in name:
+        name = _RE_UNDER.sub("_", name)
+    name = name.strip("._-")
 
     if not name:
         return fallback
     return name
 
 
+_IFIND_WINDOW = 1 << 16
+
+
+@functools.lru_cache(maxsize=256)
+def _ifind_re(q: str) -> "re.Pattern[str]":
+    return re.compile(re.escape(q), re.IGNORECASE)
+
+
+def _ifind(text: str, q: str) -> int:
+    """Case-insensitive text.find(q) without lower-casing the whole text up front.
+
+    ASCII: lower-cased window by window (overlapping by len(q)-1), stopping at the first
+    hit. Otherwise re's IGNORECASE scan (pattern cached per query), which also keeps
+    offsets right when lower() would change the length (e.g. 'İ').
+    """
+    if text.isascii() and q.isascii():
+        low_q = q.lower()
+        overlap = len(q) - 1
+        for start in range(0, len(text), _IFIND_WINDOW):
+            idx = text[start : start + _IFIND_WINDOW + overlap].lower().find(low_q)
+            if idx >= 0:
+                return start + idx
+        return -1
+    m = _ifind_re(q).search(text)
+    return m.start() if m else -1
+
+
 def make_snippet(text: str, q: str, radius: int = 80) -> str:
     """
     Returns a small snippet around the first occurrence of q in text.
@@ -122,9 +181,7 @@ def make_snippet(text: str, q: str, radius: int = 80) -> str:
     if not q2:
         return (t[:radius * 2] + "…") if len(t) > radius * 2 else t
 
-    low_t = t.lower()
-    low_q = q2.lower()
-    idx = low_t.find(low_q)
+    idx = _ifind(t, q2)
     if idx < 0:
         return (t[:radius * 2] + "…") if len(t) > radius * 2 else t
 
@@ -135,56 +192,178 @@ def make_snippet(text: str, q: str, radius: int = 80) -> str:
     return prefix + t[start:end].replace("\n", " ").strip() + suffix
 
 
-def pdf_page_count(pdf_bytes: bytes) -> int:
-    reader = PdfReader(io.BytesIO(pdf_bytes))
-    return len(reader.pages)
+# The text/page-count helpers also take a PDF file path: qpdf and MuPDF then read the
+# file themselves, and pypdf reads it through a read-only mmap, so the file is never
+# copied into a bytes object (nor that into a BytesIO) first.
+def _is_path(src) -> bool:
+    return isinstance(src, (str, Path))
+
 
+@contextlib.contextmanager
+def _pypdf_source(src) -> Iterator:
+    if _is_path(src):
+        with open(src, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+    else:
+        yield io.BytesIO(src)
+
+
+def pdf_page_count(pdf_bytes: "bytes | str | Path") -> int:
+    # qpdf reads the xref in C++; pypdf parses it in Python before reading /Count
+    if pikepdf is not None:
+        try:
+            with pikepdf.open(pdf_bytes if _is_path(pdf_bytes) else io.BytesIO(pdf_bytes)) as pdf:
+                return len(pdf.pages)
+        except Exception:
+            pass
 
-def extract_text_from_pdf(pdf_bytes: bytes, max_pages: int = 25) -> str:
+    with _pypdf_source(pdf_bytes) as stream:
+        reader = PdfReader(stream)
+        return len(reader.pages)
+
+
+def extract_text_from_pdf(pdf_bytes: "bytes | str | Path", max_pages: int = 25) -> str:
     """
-    Simple text extraction from PDF (pypdf).
+    Simple text extraction from PDF (PyMuPDF if installed, else pypdf).
     Good for text-based PDFs; scanned PDFs -> OCR later.
+    pdf_bytes may also be a path to the PDF on disk.
     """
-    reader = PdfReader(io.BytesIO(pdf_bytes))
-    out = []
-    for i, page in enumerate(reader.pages[:max_pages]):
+    if fitz is not None:
+        # MuPDF's extractor is C and several times faster than pypdf's, so pages stay
+        # serial and in-process (a document must not be shared across threads).
         try:
-            out.append(page.extract_text() or "")
+            if _is_path(pdf_bytes):
+                doc = fitz.open(pdf_bytes, filetype="pdf")
+            else:
+                doc = fitz.open(stream=pdf_bytes, filetype="pdf")
         except Exception:
-            out.append("")
+            doc = None
+        if doc is not None:
+            try:
+                out = []
+                for i in range(min(int(max_pages), doc.page_count)):
+                    try:
+                        out.append(doc.load_page(i).get_text("text") or "")
+                    except Exception:
+                        out.append("")
+            finally:
+                doc.close()
+            return "\n".join(out).strip()
+
+    with _pypdf_source(pdf_bytes) as stream:
+        reader = PdfReader(stream)
+        limit = min(max(int(max_pages), 0), len(reader.pages))
+
+        # serial: callers already run this off the event loop (main.py: PDF_POOL / threadpool)
+        out = []
+        for page in reader.pages[:limit]:
+            try:
+                out.append(page.extract_text() or "")
+            except Exception:
+                out.append("")
     return "\n".join(out).strip()
 
 
-def compress_pdf_bytes(pdf_bytes: bytes) -> bytes:
+def _writer_bytes(writer: PdfWriter) -> bytes:
+    """Serialize a writer to bytes.
+
+    Callers store the result (and count/extract from it), so the whole file is needed;
+    a fresh BytesIO's getvalue() hands its buffer over without a copy, whereas
+    bytes(buf.getbuffer()) or a bytearray-backed writer would add one.
+    """
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+# qpdf's deflate level is a process-wide setting: set + save under one lock
+_FLATE_LEVEL_LOCK = threading.Lock()
+
+
+# Small files already packed into object streams (qpdf/our own compress output, most
+# modern producers) gain next to nothing from another parse + deflate round.
+_COMPACT_MAX_BYTES = 100_000
+_OBJSTM_RE = re.compile(rb"/Type\s*/ObjStm\b")
+
+
+def _already_compact(pdf_bytes: bytes) -> bool:
+    return len(pdf_bytes) < _COMPACT_MAX_BYTES and _OBJSTM_RE.search(pdf_bytes) is not None
+
+
+def compress_pdf_bytes(pdf_bytes: bytes, level: int = 9, linearize: bool = False) -> bytes:
     """
     Basic compression: re-write PDF and compress content streams.
     Not guaranteed huge savings, but usually helps a bit.
+
+    With pikepdf, qpdf re-deflates every stream and packs objects into object streams
+    (all in C++); the pypdf rewrite is kept as fallback.
+    level: zlib level 0..9 (-1 = zlib default); 9 gives the smallest streams.
+    linearize: qpdf "fast web view" layout (first page readable before the download
+    ends); pikepdf only, slightly larger output.
+    Small inputs that already use object streams are returned unchanged.
     """
+    level = max(-1, min(int(level), 9))
+    if not linearize and _already_compact(pdf_bytes):
+        return pdf_bytes
+
+    if pikepdf is not None:
+        try:
+            with pikepdf.open(io.BytesIO(pdf_bytes)) as pdf:
+                return _save_compressed(pdf, level, linearize=linearize)
+        except Exception:
+            pass
+
     reader = PdfReader(io.BytesIO(pdf_bytes))
     writer = PdfWriter()
 
     for p in reader.pages:
         writer.add_page(p)
 
-    # compress streams if possible
-    try:
-        writer.compress_content_streams()
-    except Exception:
-        pass
+    _compress_writer_pages(writer, level)
+    return _writer_bytes(writer)
+
 
+def _save_compressed(pdf, level: int, linearize: bool = False) -> bytes:
+    """Save a pikepdf.Pdf with every stream re-deflated at `level` and objects packed
+    into object streams."""
     buf = io.BytesIO()
-    writer.write(buf)
+    with _FLATE_LEVEL_LOCK:
+        pikepdf.settings.set_flate_compression_level(level)
+        pdf.save(
+            buf,
+            compress_streams=True,
+            object_stream_mode=pikepdf.ObjectStreamMode.generate,
+            stream_decode_level=pikepdf.StreamDecodeLevel.generalized,
+            recompress_flate=True,
+            linearize=linearize,
+        )
     return buf.getvalue()
 
 
+def _compress_writer_pages(writer: PdfWriter, level: int) -> None:
+    # compress streams if possible (a page method: PdfWriter itself has none)
+    for page in writer.pages:
+        try:
+            page.compress_content_streams(level=level)
+        except Exception:
+            pass
+
+
 def split_pdf_bytes(pdf_bytes: bytes,
                     ranges: List[Tuple[int, int]]) -> List[Tuple[str, bytes]]:
     """
     ranges: list of (start_page, end_page) 1-based inclusive.
     returns list of (filename, pdf_bytes)
     """
+    if pikepdf is not None:
+        try:
+            return _split_pdf_pikepdf(pdf_bytes, ranges)
+        except Exception:
+            pass
+
     reader = PdfReader(io.BytesIO(pdf_bytes))
-    total = len(reader.pages)
+    pages = list(reader.pages)
+    total = len(pages)
 
     outputs: List[Tuple[str, bytes]] = []
     for idx, (a, b) in enumerate(ranges, start=1):
@@ -194,16 +373,59 @@ def split_pdf_bytes(pdf_bytes: bytes,
             continue
 
         writer = PdfWriter()
-        for p in range(a - 1, b):
-            writer.add_page(reader.pages[p])
+        for page in pages[a - 1 : b]:
+            writer.add_page(page)
 
-        buf = io.BytesIO()
-        writer.write(buf)
-        outputs.append((f"split_{idx}_{a}-{b}.pdf", buf.getvalue()))
+        outputs.append((f"split_{idx}_{a}-{b}.pdf", _writer_bytes(writer)))
+
+    return outputs
+
+
+def _split_pdf_pikepdf(pdf_bytes: bytes, ranges: List[Tuple[int, int]]) -> List[Tuple[str, bytes]]:
+    """split_pdf_bytes on qpdf: the source is parsed once and every part copies its
+    pages (with the objects they reference) in C++; one destination open at a time."""
+    outputs: List[Tuple[str, bytes]] = []
+    with pikepdf.open(io.BytesIO(pdf_bytes)) as src:
+        pages = list(src.pages)
+        total = len(pages)
+        for idx, (a, b) in enumerate(ranges, start=1):
+            a = max(1, int(a))
+            b = min(total, int(b))
+            if a > b:
+                continue
+
+            buf = io.BytesIO()
+            with pikepdf.Pdf.new() as dst:
+                dst.pages.extend(pages[a - 1 : b])
+                dst.save(buf)
+            outputs.append((f"split_{idx}_{a}-{b}.pdf", buf.getvalue()))
 
     return outputs
 
 
+_PAGE_TOKEN_RE = re.compile(r"\s*(\d+)\s*(?:-\s*(\d+)\s*)?")
+_PAGE_SEP_RE = re.compile(r"[,;]")
+
+
+def _page_tokens(text: str) -> List[Tuple[int, int]]:
+    """(a, b) per token with 1 <= a <= b; ValueError on anything else."""
+    out: List[Tuple[int, int]] = []
+    for p in _PAGE_SEP_RE.split(text or ""):
+        if not p.strip():
+            continue
+        m = _PAGE_TOKEN_RE.fullmatch(p)
+        if m is None:
+            raise ValueError(f"Invalid range token: {p.strip()!r}")
+        a = int(m[1])
+        b = int(m[2]) if m[2] else a
+        if a <= 0 or b <= 0:
+            raise ValueError("Page numbers must be >= 1")
+        if a > b:
+            a, b = b, a
+        out.append((a, b))
+    return out
+
+
 def parse_ranges(ranges_text: str) -> List[Tuple[int, int]]:
     """
     Parses 1-based inclusive page ranges.
@@ -212,65 +434,144 @@ def parse_ranges(ranges_text: str) -> List[Tuple[int, int]]:
       "1-3, 5, 7-10" -> [(1,3),(5,5),(7,10)]
       " 2 ; 4-6 "    -> [(2,2),(4,6)]
     """
-    s = (ranges_text or "").strip()
-    if not s:
-        return []
+    return _page_tokens(ranges_text)
 
-    # allow ";" as separator too
-    s = s.replace(";", ",")
-    parts = [p.strip() for p in s.split(",") if p.strip()]
 
-    out: List[Tuple[int, int]] = []
-    for p in parts:
-        if "-" in p:
-            x, y = p.split("-", 1)
-            x = x.strip()
-            y = y.strip()
-            if not x or not y:
-                raise ValueError(f"Invalid range token: {p!r}")
-            a = int(x)
-            b = int(y)
-            if a <= 0 or b <= 0:
-                raise ValueError("Page numbers must be >= 1")
-            if a > b:
-                a, b = b, a
-            out.append((a, b))
-        else:
-            n = int(p)
-            if n <= 0:
-                raise ValueError("Page numbers must be >= 1")
-            out.append((n, n))
-    return out
+def merge_pdf_bytes(pdf_list: List[bytes], compress: bool = False, level: int = 9) -> bytes:
+    """Merge multiple PDFs (in order).
 
+    compress=True applies compress_pdf_bytes' treatment in the same save, so merging
+    and compressing costs one parse + serialize instead of two.
+    """
+    level = max(-1, min(int(level), 9))
+    if pikepdf is not None:
+        try:
+            # qpdf copies foreign stream data when saving: sources stay open until then
+            with contextlib.ExitStack() as stack:
+                dst = stack.enter_context(pikepdf.Pdf.new())
+                for bts in pdf_list:
+                    src = stack.enter_context(pikepdf.open(io.BytesIO(bts)))
+                    dst.pages.extend(src.pages)
+                if compress:
+                    return _save_compressed(dst, level)
+                buf = io.BytesIO()
+                dst.save(buf)
+                return buf.getvalue()
+        except Exception:
+            pass
 
-def merge_pdf_bytes(pdf_list: List[bytes]) -> bytes:
-    """Merge multiple PDFs (in order)."""
     writer = PdfWriter()
     for bts in pdf_list:
         reader = PdfReader(io.BytesIO(bts))
         for p in reader.pages:
             writer.add_page(p)
 
+    if compress:
+        _compress_writer_pages(writer, level)
+    return _writer_bytes(writer)
+
+
+def _page_mask(total: int, ranges: List[Tuple[int, int]]) -> bytearray:
+    """mask[i] == 1 for each 1-based page i (<= total) covered by ranges; each range is
+    one slice fill instead of a set insert per page."""
+    mask = bytearray(total + 1)
+    for a, b in ranges:
+        a = max(1, int(a))
+        b = min(total, int(b))
+        if a <= b:
+            mask[a : b + 1] = b"\x01" * (b - a + 1)
+    return mask
+
+
+def _pikepdf_pages_bytes(pages) -> bytes:
+    """New PDF made of `pages` (pikepdf pages, repeats allowed); qpdf copies each page
+    with the objects it references in C++ instead of pypdf's Python object-graph clone."""
     buf = io.BytesIO()
-    writer.write(buf)
+    with pikepdf.Pdf.new() as dst:
+        dst.pages.extend(pages)
+        dst.save(buf)
     return buf.getvalue()
 
 
+def _delete_pages_pikepdf(pdf_bytes: bytes, ranges: List[Tuple[int, int]]) -> bytes:
+    with pikepdf.open(io.BytesIO(pdf_bytes)) as src:
+        pages = list(src.pages)
+        total = len(pages)
+        to_delete = _page_mask(total, ranges)
+        keep = [page for idx, page in enumerate(pages, start=1) if not to_delete[idx]]
+        # don't output an empty PDF
+        if not keep:
+            return pdf_bytes
+        return _pikepdf_pages_bytes(keep)
+
+
+def _rotate_pages_pikepdf(pdf_bytes: bytes, ranges: List[Tuple[int, int]], deg: int) -> bytes:
+    with pikepdf.open(io.BytesIO(pdf_bytes)) as src:
+        pages = list(src.pages)
+        total = len(pages)
+        to_rotate = _page_mask(total, ranges)
+        # every page is kept, so only /Rotate changes: qpdf's rotatePage (which also
+        # honours an inherited /Rotate) on the selected pages, then save src itself
+        # instead of copying all pages into a new document
+        for idx, page in enumerate(pages, start=1):
+            if to_rotate[idx]:
+                page.rotate(deg, relative=True)
+        buf = io.BytesIO()
+        src.save(buf)
+        return buf.getvalue()
+
+
+def _extract_pages_pikepdf(pdf_bytes: bytes, ranges: List[Tuple[int, int]]) -> bytes:
+    with pikepdf.open(io.BytesIO(pdf_bytes)) as src:
+        pages = list(src.pages)
+        total = len(pages)
+        seq = []
+        for a, b in ranges:
+            a = int(a)
+            b = int(b)
+            if a <= 0 or b <= 0:
+                raise ValueError("Page numbers must be >= 1")
+            if a > b:
+                a, b = b, a
+            if a > total:
+                continue
+            seq.extend(pages[a - 1 : min(b, total)])
+
+        if not seq:
+            raise ValueError("No pages selected")
+        return _pikepdf_pages_bytes(seq)
+
+
+def _reorder_pages_pikepdf(pdf_bytes: bytes, sequence: List[int]) -> bytes:
+    with pikepdf.open(io.BytesIO(pdf_bytes)) as src:
+        pages = list(src.pages)
+        total = len(pages)
+        if not sequence:
+            raise ValueError("No page sequence provided")
+        for n in sequence:
+            if n < 1 or n > total:
+                raise ValueError(f"Page {n} out of range (1..{total})")
+        return _pikepdf_pages_bytes([pages[n - 1] for n in sequence])
+
+
 def delete_pages_pdf_bytes(pdf_bytes: bytes, ranges: List[Tuple[int, int]]) -> bytes:
     """Delete pages in 1-based inclusive ranges."""
+    if pikepdf is not None:
+        try:
+            return _delete_pages_pikepdf(pdf_bytes, ranges)
+        except ValueError:
+            raise
+        except Exception:
+            pass
+
     reader = PdfReader(io.BytesIO(pdf_bytes))
     total = len(reader.pages)
 
-    to_delete = set()
-    for a, b in ranges:
-        a = max(1, int(a))
-        b = min(total, int(b))
-        for i in range(a, b + 1):
-            to_delete.add(i)
+    to_delete = _page_mask(total, ranges)
 
     writer = PdfWriter()
     for idx, page in enumerate(reader.pages, start=1):
-        if idx in to_delete:
+        if to_delete[idx]:
             continue
         writer.add_page(page)
 
@@ -278,9 +579,7 @@ def delete_pages_pdf_bytes(pdf_bytes: bytes, ranges: List[Tuple[int, int]]) -> b
     if len(writer.pages) == 0:
         return pdf_bytes
 
-    buf = io.BytesIO()
-    writer.write(buf)
-    return buf.getvalue()
+    return _writer_bytes(writer)
 
 
 def rotate_pages_pdf_bytes(pdf_bytes: bytes, ranges: List[Tuple[int, int]], degrees: int) -> bytes:
@@ -289,19 +588,22 @@ def rotate_pages_pdf_bytes(pdf_bytes: bytes, ranges: List[Tuple[int, int]], degr
     if deg % 90 != 0:
         raise ValueError("degrees must be multiple of 90")
 
+    if pikepdf is not None:
+        try:
+            return _rotate_pages_pikepdf(pdf_bytes, ranges, deg)
+        except ValueError:
+            raise
+        except Exception:
+            pass
+
     reader = PdfReader(io.BytesIO(pdf_bytes))
     total = len(reader.pages)
 
-    to_rotate = set()
-    for a, b in ranges:
-        a = max(1, int(a))
-        b = min(total, int(b))
-        for i in range(a, b + 1):
-            to_rotate.add(i)
+    to_rotate = _page_mask(total, ranges)
 
     writer = PdfWriter()
     for idx, page in enumerate(reader.pages, start=1):
-        if idx in to_rotate:
+        if to_rotate[idx]:
             try:
                 page.rotate(deg)
             except Exception:
@@ -312,9 +614,7 @@ def rotate_pages_pdf_bytes(pdf_bytes: bytes, ranges: List[Tuple[int, int]], degr
                     pass
         writer.add_page(page)
 
-    buf = io.BytesIO()
-    writer.write(buf)
-    return buf.getvalue()
+    return _writer_bytes(writer)
 
 
 def parse_page_sequence(sequence_text: str, total_pages: int) -> List[int]:
@@ -328,36 +628,11 @@ def parse_page_sequence(sequence_text: str, total_pages: int) -> List[int]:
 
     Raises ValueError on invalid tokens or out-of-range pages.
     """
-    s = (sequence_text or "").strip()
-    if not s:
-        return []
-
-    s = s.replace(";", ",")
-    parts = [p.strip() for p in s.split(",") if p.strip()]
-
     seq: List[int] = []
-    for p in parts:
-        if "-" in p:
-            x, y = p.split("-", 1)
-            x = x.strip()
-            y = y.strip()
-            if not x or not y:
-                raise ValueError(f"Invalid range token: {p!r}")
-            a = int(x)
-            b = int(y)
-            if a <= 0 or b <= 0:
-                raise ValueError("Page numbers must be >= 1")
-            if a > b:
-                a, b = b, a
-            for n in range(a, b + 1):
-                if n < 1 or n > total_pages:
-                    raise ValueError(f"Page {n} out of range (1..{total_pages})")
-                seq.append(n)
-        else:
-            n = int(p)
-            if n < 1 or n > total_pages:
-                raise ValueError(f"Page {n} out of range (1..{total_pages})")
-            seq.append(n)
+    for a, b in _page_tokens(sequence_text):
+        if b > total_pages:
+            raise ValueError(f"Page {max(a, total_pages + 1)} out of range (1..{total_pages})")
+        seq.extend(range(a, b + 1))
 
     return seq
 
@@ -366,6 +641,14 @@ def extract_pages_pdf_bytes(pdf_bytes: bytes, ranges: List[Tuple[int, int]]) ->
     """
     Extract pages given by inclusive ranges, keeping natural order.
     """
+    if pikepdf is not None:
+        try:
+            return _extract_pages_pikepdf(pdf_bytes, ranges)
+        except ValueError:
+            raise
+        except Exception:
+            pass
+
     reader = PdfReader(io.BytesIO(pdf_bytes))
     total = len(reader.pages)
     seq: List[int] = []
@@ -389,9 +672,7 @@ def extract_pages_pdf_bytes(pdf_bytes: bytes, ranges: List[Tuple[int, int]]) ->
     for n in seq:
         writer.add_page(reader.pages[n - 1])
 
-    buf = io.BytesIO()
-    writer.write(buf)
-    return buf.getvalue()
+    return _writer_bytes(writer)
 
 
 def reorder_pages_pdf_bytes(pdf_bytes: bytes, sequence: List[int]) -> bytes:
@@ -399,6 +680,14 @@ def reorder_pages_pdf_bytes(pdf_bytes: bytes, sequence: List[int]) -> bytes:
     Reorder / duplicate pages based on sequence (1-based).
     Example: [3,1,1,2] duplicates page 1.
     """
+    if pikepdf is not None:
+        try:
+            return _reorder_pages_pikepdf(pdf_bytes, sequence)
+        except ValueError:
+            raise
+        except Exception:
+            pass
+
     reader = PdfReader(io.BytesIO(pdf_bytes))
     total = len(reader.pages)
     if not sequence:
@@ -410,6 +699,4 @@ def reorder_pages_pdf_bytes(pdf_bytes: bytes, sequence: List[int]) -> bytes:
             raise ValueError(f"Page {n} out of range (1..{total})")
         writer.add_page(reader.pages[n - 1])
 
-    buf = io.BytesIO()
-    writer.write(buf)
-    return buf.getvalue()
+    return _writer_bytes(writer)